@@ -64,6 +64,7 @@ def create_app(config_class=None):
     from app.routes.oauth import oauth_bp, init_oauth
     from app.routes.events import events_bp
     from app.routes.videochat import videochat_bp
+    from app.routes.metrics import metrics_bp
 
     app.register_blueprint(auth_bp, url_prefix="/auth")
     app.register_blueprint(profile_bp, url_prefix="/profile")
@@ -74,6 +75,7 @@ def create_app(config_class=None):
     app.register_blueprint(oauth_bp, url_prefix="/oauth")
     app.register_blueprint(events_bp, url_prefix="/events")
     app.register_blueprint(videochat_bp, url_prefix="/videochat")
+    app.register_blueprint(metrics_bp, url_prefix="/metrics")
 
     if (
         app.config.get("GOOGLE_CLIENT_ID")
@@ -82,6 +84,20 @@ def create_app(config_class=None):
     ):
         init_oauth(app)
 
+    if (
+        app.config.get("FAME_MODE") == "batch"
+        and app.config.get("FAME_BATCH_INTERVAL", 0) > 0
+        and not app.config.get("TESTING")
+    ):
+        from app.utils.fame import start_fame_scheduler
+        start_fame_scheduler(app, app.config["FAME_BATCH_INTERVAL"])
+
+    import multiprocessing
+    # Not inside the pool's own (spawned) workers, which import this module again.
+    if app.config.get("SCORING_WORKERS", 0) > 0 and multiprocessing.parent_process() is None:
+        from app.utils.scoring_pool import start_scoring_pool
+        start_scoring_pool(app, app.config["SCORING_WORKERS"])
+
     from app.utils.tags import tags_display_form_value
 
     @app.template_filter("tags_form_value")
@@ -127,6 +143,14 @@ def create_app(config_class=None):
         from flask import send_from_directory
         return send_from_directory(app.config.get("UPLOAD_FOLDER", "./app/uploads"), filename)
 
+    from app.database import PoolTimeout
+
+    @app.errorhandler(PoolTimeout)
+    def handle_pool_timeout(e):
+        # Every pooled connection stayed busy for DB_POOL_TIMEOUT seconds: ask the client to retry.
+        app.logger.warning(f"[DB_POOL] {e}")
+        return "The server is busy, please retry in a moment.", 503, {"Retry-After": "1"}
+
     @app.errorhandler(RequestEntityTooLarge)
     def handle_file_too_large(e):
         # When MAX_CONTENT_LENGTH is exceeded, Flask rejects the request before our route runs.
@@ -156,4 +180,55 @@ def create_app(config_class=None):
         commit()
         click.echo("Database tables created.")
 
+    @app.cli.command("backfill-geo-cells")
+    @click.option("--all", "recompute_all", is_flag=True, help="Recompute cells for every located user.")
+    def backfill_geo_cells_command(recompute_all):
+        from app.utils.geocell import backfill_geo_cells
+        updated = backfill_geo_cells(recompute_all)
+        click.echo(f"Geo cells updated for {updated} users.")
+
+    @app.cli.command("backfill-tag-masks")
+    @click.option("--all", "recompute_all", is_flag=True, help="Rebuild masks for every user.")
+    def backfill_tag_masks_command(recompute_all):
+        from app.utils.tags import backfill_tag_masks
+        updated = backfill_tag_masks(recompute_all)
+        click.echo(f"Tag masks updated for {updated} users.")
+
+    @app.cli.command("reconcile-fame")
+    @click.option("--fix", is_flag=True, help="Rewrite the drifted counters and fame ratings.")
+    def reconcile_fame_command(fix):
+        from app.utils.fame import reconcile_fame
+        drift = reconcile_fame(fix)
+        for r in drift:
+            click.echo(
+                f"user {r['id']}: likes {r['stored_likes']}->{r['likes_received']}, "
+                f"views {r['stored_views']}->{r['views_received']}, "
+                f"connections {r['stored_connections']}->{r['connections']}, "
+                f"fame {r['stored_fame']}->{r['fame_rating']}"
+            )
+        click.echo(f"{len(drift)} users drifted" + (", fixed." if fix and drift else "."))
+
+    @app.cli.command("recompute-fame")
+    @click.option("--all", "recompute_all", is_flag=True, help="Recompute every user, not only dirty ones.")
+    def recompute_fame_command(recompute_all):
+        from app.utils.fame import recompute_fame
+        updated = recompute_fame(recompute_all)
+        if updated is None:
+            click.echo("Another fame recompute is running.")
+        else:
+            click.echo(f"Fame recomputed for {updated} users.")
+
+    @app.cli.command("build-colike")
+    @click.option("--top-n", type=int, help="Neighbours kept per user (default COLIKE_NEIGHBOURS).")
+    @click.option("--chunk-size", type=int, default=1000, show_default=True, help="Liked users per transaction.")
+    def build_colike_command(top_n, chunk_size):
+        from app.utils.colike import build_colike_neighbours
+        from app.utils.suggestion_cache import invalidate_all_suggestions
+        built = build_colike_neighbours(top_n, chunk_size)
+        if built is None:
+            click.echo("Another co-like build is running.")
+        else:
+            invalidate_all_suggestions()
+            click.echo(f"Co-like neighbours built for {built} users.")
+
     return app
@@ -19,6 +19,60 @@ class Config:
     # If true, registration will show a verification link instead of sending email.
     # SHOW_VERIFICATION_LINK = os.environ.get("SHOW_VERIFICATION_LINK", "false").lower() == "true"
 
+    # Connection pool: DB_POOL_MIN connections are kept open, up to DB_POOL_MAX are checked out at
+    # once; a request waits up to DB_POOL_TIMEOUT seconds for one (then 503). Connections idle for
+    # more than DB_POOL_HEALTH_CHECK_IDLE seconds are pinged before reuse (0 disables).
+    DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 2))
+    DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+    DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5))
+    DB_POOL_HEALTH_CHECK_IDLE = float(os.environ.get("DB_POOL_HEALTH_CHECK_IDLE", 30))
+    # Read replicas (comma-separated URLs, each with its own pool): query_one/query_all/query_tuples go
+    # there unless the request already wrote; a client that wrote keeps reading from the primary for
+    # DATABASE_REPLICA_STICKY_SECONDS so it sees its own changes despite replication lag.
+    DATABASE_REPLICA_URLS = os.environ.get("DATABASE_REPLICA_URLS", "")
+    DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get("DATABASE_REPLICA_STICKY_SECONDS", 5))
+    # Run reads in autocommit so read-only requests skip BEGIN/COMMIT; the first write of a request
+    # opens a transaction. Requests holding their connection longer than DB_HOLD_WARN_MS are logged.
+    DB_READ_AUTOCOMMIT = os.environ.get("DB_READ_AUTOCOMMIT", "true").lower() == "true"
+    DB_HOLD_WARN_MS = int(os.environ.get("DB_HOLD_WARN_MS", 1000))
+    # Rows query_iter() fetches per round trip from its server-side cursor.
+    QUERY_ITER_FETCH_SIZE = int(os.environ.get("QUERY_ITER_FETCH_SIZE", 2000))
+
+    # "python" scores candidates in the app, "numpy" does the same on arrays (falls back to
+    # "python" when NumPy is not installed), "sql" ranks and pages them inside PostgreSQL.
+    MATCHING_ENGINE = os.environ.get("MATCHING_ENGINE", "python")
+    # Seconds a viewer's ranked suggestions stay cached (0 disables the cache).
+    SUGGESTIONS_CACHE_TTL = int(os.environ.get("SUGGESTIONS_CACHE_TTL", 120))
+    # Ranked rows kept per cache entry (python/numpy engines); deeper pages are ranked on demand.
+    SUGGESTIONS_CACHE_DEPTH = int(os.environ.get("SUGGESTIONS_CACHE_DEPTH", 500))
+    # "incremental" adjusts fame counters inside each like/unlike/block/view transaction; "batch" only
+    # marks users dirty for `flask recompute-fame` or, when FAME_BATCH_INTERVAL > 0, an in-process
+    # thread recomputing them every FAME_BATCH_INTERVAL seconds.
+    FAME_MODE = os.environ.get("FAME_MODE", "incremental")
+    FAME_BATCH_INTERVAL = int(os.environ.get("FAME_BATCH_INTERVAL", 0))
+    # Answer the browse `tags` filter from an in-process tag -> user ids index, refreshed from the
+    # database in a background thread once it is older than TAG_INDEX_MAX_AGE seconds (edits in
+    # this process apply at once).
+    TAG_INDEX_ENABLED = os.environ.get("TAG_INDEX_ENABLED", "true").lower() == "true"
+    TAG_INDEX_MAX_AGE = int(os.environ.get("TAG_INDEX_MAX_AGE", 300))
+    # Score points per co-like similarity point (see `flask build-colike`); 0 ranks without them.
+    COLIKE_WEIGHT = int(os.environ.get("COLIKE_WEIGHT", 0))
+    # Neighbours kept per liked user by `flask build-colike`.
+    COLIKE_NEIGHBOURS = int(os.environ.get("COLIKE_NEIGHBOURS", 50))
+    # Worker processes for the python engine's scoring of very large candidate sets (0 = none);
+    # they are only used from SCORING_PARALLEL_THRESHOLD candidates on.
+    SCORING_WORKERS = int(os.environ.get("SCORING_WORKERS", 0))
+    SCORING_PARALLEL_THRESHOLD = int(os.environ.get("SCORING_PARALLEL_THRESHOLD", 40000))
+    # Run the hot queries (built with app.database.prepared) as server-side prepared statements, so
+    # each pooled connection parses and plans them once. Keep off behind transaction-mode poolers.
+    # The python engine's streamed candidate scan (query_iter) always runs unprepared: a server-side
+    # cursor cannot be declared over EXECUTE, and flat memory wins over the saved planning there.
+    PREPARED_STATEMENTS = os.environ.get("PREPARED_STATEMENTS", "false").lower() == "true"
+    # Seconds a user's block set stays cached for chat/call/like checks (dropped on block).
+    BLOCK_CACHE_TTL = int(os.environ.get("BLOCK_CACHE_TTL", 300))
+    # Expose process-local cache/pool counters as JSON at /metrics/.
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "false").lower() == "true"
+
     VERIFICATION_TOKEN_EXPIRY_HOURS = 24
     RESET_TOKEN_EXPIRY_HOURS = 1
 
@@ -1,11 +1,190 @@
+import hashlib
+import itertools
+import operator
+import threading
+import time
+import weakref
+from functools import lru_cache
 import psycopg2
-from psycopg2.pool import ThreadedConnectionPool
-from psycopg2.extras import RealDictCursor
+from psycopg2 import errors
+from psycopg2.extensions import connection as _PgConnection, TRANSACTION_STATUS_IDLE
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+import psycopg2.extras
 from types import SimpleNamespace
-from flask import g
+from flask import g, current_app, request, session, has_request_context
 
 pool = None
 _database_url = None
+_hold_lock = threading.Lock()
+_hold_stats = {}
+_replica_pools = []
+_replica_urls = []
+_replica_turn = itertools.count()
+_routing_lock = threading.Lock()
+_routing = {"replica": 0, "primary": 0, "fallback": 0}
+_iter_names = itertools.count()
+
+
+# Upper bounds (ms) of the checkout wait histogram buckets; the last bucket is unbounded.
+_WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class _Connection(_PgConnection):
+    """Pooled connection that remembers which Statements its server session has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.deallocate = False
+        self.returned_at = time.monotonic()
+        # query_iter() took this autocommit connection into a transaction it has to end itself.
+        self.streaming = False
+
+
+class PoolTimeout(PoolError):
+    """No pooled connection became free within the pool's timeout."""
+
+
+class BlockingPool(ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool whose getconn() waits up to `timeout` seconds for a connection instead
+    of raising as soon as maxconn are checked out, and pings connections that sat idle for more than
+    `health_check_idle` seconds (0 disables) before handing them out, replacing dead ones.
+    Connections beyond minconn are closed when returned, as in ThreadedConnectionPool.
+    """
+
+    def __init__(self, minconn, maxconn, *args, timeout=5.0, health_check_idle=30.0, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.timeout = timeout
+        self.health_check_idle = health_check_idle
+        self._available = threading.Condition()
+        self._stats = {
+            "checkouts": 0, "timeouts": 0, "discarded": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0,
+        }
+        self._wait_counts = [0] * (len(_WAIT_BUCKETS_MS) + 1)
+
+    def getconn(self, key=None):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            with self._available:
+                while True:
+                    try:
+                        conn = super().getconn(key)
+                        break
+                    except PoolError:
+                        if self.closed:
+                            raise
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats["timeouts"] += 1
+                            raise PoolTimeout(f"no database connection free within {self.timeout}s")
+                        self._available.wait(remaining)
+            if self._healthy(conn):
+                break
+            with self._available:
+                self._stats["discarded"] += 1
+            self.putconn(conn, key, close=True)
+        self._record_wait((time.monotonic() - started) * 1000)
+        return conn
+
+    def putconn(self, conn=None, key=None, close=False):
+        if conn is not None:
+            conn.returned_at = time.monotonic()
+        super().putconn(conn, key, close)
+        with self._available:
+            self._available.notify()
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        if not self.health_check_idle or time.monotonic() - conn.returned_at < self.health_check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _record_wait(self, wait_ms):
+        bucket = next((i for i, bound in enumerate(_WAIT_BUCKETS_MS) if wait_ms <= bound), -1)
+        with self._available:
+            self._stats["checkouts"] += 1
+            self._stats["wait_ms_total"] += wait_ms
+            self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait_ms)
+            self._wait_counts[bucket] += 1
+
+    def stats(self):
+        with self._lock:
+            in_use, idle = len(self._used), len(self._pool)
+        with self._available:
+            stats = dict(self._stats)
+            counts = list(self._wait_counts)
+        stats.update({
+            "min": self.minconn, "max": self.maxconn, "in_use": in_use, "idle": idle,
+            "timeout_s": self.timeout,
+            "wait_ms_total": round(stats["wait_ms_total"], 2),
+            "wait_ms_max": round(stats["wait_ms_max"], 2),
+            "wait_ms_buckets": dict(zip([str(b) for b in _WAIT_BUCKETS_MS] + ["+Inf"], counts)),
+        })
+        return stats
+
+
+class Statement:
+    """
+    A query the helpers run as a named server-side prepared statement when PREPARED_STATEMENTS is
+    on (plain execute otherwise). Positional %s placeholders only; build them with prepared().
+    """
+
+    __slots__ = ("sql", "name", "prepare_sql", "execute_sql")
+
+    def __init__(self, sql):
+        n = sql.count("%s")
+        self.sql = sql
+        self.name = "q_" + hashlib.sha1(sql.encode()).hexdigest()[:16]
+        self.prepare_sql = f"PREPARE {self.name} AS " + sql % tuple(f"${i}" for i in range(1, n + 1))
+        self.execute_sql = f"EXECUTE {self.name}" + (f" ({', '.join(['%s'] * n)})" if n else "")
+
+
+@lru_cache(maxsize=512)
+def prepared(sql):
+    """The Statement for `sql`; each connection prepares it on first use (again after a reconnect)."""
+    return Statement(sql)
+
+
+def _run(cur, sql, params):
+    if isinstance(sql, Statement):
+        if not current_app.config.get("PREPARED_STATEMENTS", False):
+            cur.execute(sql.sql, params)
+            return
+        conn = cur.connection
+        if conn.deallocate:
+            cur.execute("DEALLOCATE ALL")
+            conn.prepared.clear()
+            conn.deallocate = False
+        if sql.name not in conn.prepared:
+            cur.execute(sql.prepare_sql)
+            conn.prepared.add(sql.name)
+        try:
+            cur.execute(sql.execute_sql, params)
+        except (errors.InvalidSqlStatementName, errors.FeatureNotSupported):
+            # Session reset behind our back, or a schema change altered a SELECT *'s columns
+            # ("cached plan must not change result type"): start over once this transaction is gone.
+            conn.deallocate = True
+            raise
+        return
+    cur.execute(sql, params)
+
+
+def _new_pool(app, url):
+    return BlockingPool(
+        app.config.get("DB_POOL_MIN", 2), app.config.get("DB_POOL_MAX", 10), url,
+        timeout=app.config.get("DB_POOL_TIMEOUT", 5.0),
+        health_check_idle=app.config.get("DB_POOL_HEALTH_CHECK_IDLE", 30.0),
+        connection_factory=_Connection,
+    )
 
 
 def init_db(app):
@@ -13,6 +192,7 @@ def init_db(app):
     new_url = app.config.get("DATABASE_URL") or app.config.get(
         "SQLALCHEMY_DATABASE_URI", "postgresql://localhost/matcha_db"
     )
+    init_replicas(app, app.config.get("DATABASE_REPLICA_URLS"))
     if pool is not None and _database_url == new_url:
         app.teardown_appcontext(_teardown)
         return
@@ -22,69 +202,414 @@ def init_db(app):
         except Exception:
             pass
     _database_url = new_url
-    pool = ThreadedConnectionPool(2, 10, _database_url)
+    pool = _new_pool(app, _database_url)
     app.teardown_appcontext(_teardown)
 
 
+def init_replicas(app, urls):
+    """(Re)build one pool per read replica URL (a list or a comma-separated string); none disables routing."""
+    global _replica_urls
+    if isinstance(urls, str):
+        urls = [u.strip() for u in urls.split(",")]
+    urls = [u for u in urls or [] if u]
+    if urls == _replica_urls:
+        return
+    for p in _replica_pools:
+        try:
+            p.closeall()
+        except Exception:
+            pass
+    _replica_pools.clear()
+    _replica_urls = urls
+    for url in urls:
+        try:
+            _replica_pools.append(_new_pool(app, url))
+        except psycopg2.OperationalError as e:
+            app.logger.error(f"[DB_REPLICA] skipping unreachable replica: {e}")
+
+
+def pool_stats():
+    """Checkout counters of the connection pool (see BlockingPool.stats), None before init_db."""
+    return pool.stats() if pool is not None else None
+
+
+def routing_stats():
+    """Where reads went: replica, primary (sticky after a write or pin_primary), fallback (replica down)."""
+    with _routing_lock:
+        stats = dict(_routing)
+    stats["replicas"] = [p.stats() for p in _replica_pools]
+    return stats
+
+
+def _route(target):
+    with _routing_lock:
+        _routing[target] += 1
+
+
+def pin_primary():
+    """Send the rest of this app context's reads to the primary (session locks, temp tables)."""
+    g.db_primary = True
+
+
+def _must_read_primary():
+    if g.get("db_wrote") or g.get("db_primary"):
+        return True
+    # Read-your-writes across requests: a client that just wrote reads from the primary for a while.
+    return has_request_context() and session.get("db_primary_until", 0) > time.time()
+
+
+def _read_db():
+    """Connection for a read: a replica, unless none is configured or this context must see its writes."""
+    if not _replica_pools:
+        return get_db()
+    if _must_read_primary():
+        _route("primary")
+        return get_db()
+    if "db_replica_conn" not in g:
+        replica_pool = _replica_pools[next(_replica_turn) % len(_replica_pools)]
+        try:
+            conn = replica_pool.getconn()
+        except (PoolError, psycopg2.OperationalError) as e:
+            current_app.logger.warning(f"[DB_REPLICA] falling back to the primary: {e}")
+            g.db_primary = True
+            _route("fallback")
+            return get_db()
+        conn.autocommit = True
+        g.db_replica_conn = conn
+        g.db_replica_pool = replica_pool
+    _route("replica")
+    return g.db_replica_conn
+
+
 def get_db():
+    """
+    This app context's connection, checked out on first use. With DB_READ_AUTOCOMMIT it starts in
+    autocommit so reads run without BEGIN/COMMIT; the first execute() opens a transaction.
+    """
     if "db_conn" not in g:
-        g.db_conn = pool.getconn()
+        conn = pool.getconn()
+        conn.autocommit = _read_autocommit()
+        g.db_conn = conn
+        g.db_checked_out = time.monotonic()
+        g.db_endpoint = request.endpoint if has_request_context() else None
     return g.db_conn
 
 
+def _read_autocommit():
+    return current_app.config.get("DB_READ_AUTOCOMMIT", True)
+
+
+def _write_db():
+    conn = get_db()
+    if conn.autocommit:
+        conn.autocommit = False
+    g.db_wrote = True
+    # A write takes over the transaction an open query_iter() started; the caller commits it.
+    conn.streaming = False
+    if _replica_pools and has_request_context():
+        sticky = current_app.config.get("DATABASE_REPLICA_STICKY_SECONDS", 5)
+        session["db_primary_until"] = time.time() + sticky
+    return conn
+
+
 def _teardown(exc=None):
+    for rows in list(g.pop("db_iters", ())):
+        rows.close()
+    replica = g.pop("db_replica_conn", None)
+    if replica is not None:
+        g.pop("db_replica_pool").putconn(replica)
     conn = g.pop("db_conn", None)
     if conn is not None:
-        if exc is None:
-            try:
-                conn.commit()
-            except Exception:
+        # Read-only contexts (autocommit, nothing written) have no transaction to end.
+        if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            if exc is None:
+                try:
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+            else:
                 conn.rollback()
-        else:
-            conn.rollback()
+        _record_hold(g.pop("db_endpoint", None), (time.monotonic() - g.pop("db_checked_out")) * 1000)
         pool.putconn(conn)
 
 
+def _record_hold(endpoint, held_ms):
+    endpoint = endpoint or "<no request>"
+    wrote = g.get("db_wrote", False)
+    with _hold_lock:
+        entry = _hold_stats.setdefault(
+            endpoint, {"requests": 0, "writes": 0, "held_ms_total": 0.0, "held_ms_max": 0.0}
+        )
+        entry["requests"] += 1
+        entry["writes"] += 1 if wrote else 0
+        entry["held_ms_total"] += held_ms
+        entry["held_ms_max"] = max(entry["held_ms_max"], held_ms)
+    if held_ms > current_app.config.get("DB_HOLD_WARN_MS", 1000):
+        current_app.logger.warning(f"[DB_HOLD] {endpoint} held a connection for {held_ms:.0f}ms")
+
+
+def hold_stats():
+    """Per endpoint: how long requests kept their pooled connection, slowest total first."""
+    with _hold_lock:
+        entries = {k: dict(v) for k, v in _hold_stats.items()}
+    for entry in entries.values():
+        entry["held_ms_avg"] = round(entry["held_ms_total"] / entry["requests"], 2)
+        entry["held_ms_total"] = round(entry["held_ms_total"], 2)
+        entry["held_ms_max"] = round(entry["held_ms_max"], 2)
+    return dict(sorted(entries.items(), key=lambda kv: -kv[1]["held_ms_total"]))
+
+
+def _count(rows):
+    # Per app context (i.e. per request); read with query_stats().
+    g.db_queries = g.get("db_queries", 0) + 1
+    g.db_rows = g.get("db_rows", 0) + max(rows, 0)
+
+
+def query_stats(reset=False):
+    stats = {"queries": g.get("db_queries", 0), "rows": g.get("db_rows", 0)}
+    if reset:
+        g.db_queries = g.db_rows = 0
+    return stats
+
+
+class Row(tuple):
+    """
+    A row from query_one/query_all/execute_returning: the column values as a tuple, readable like
+    the dicts those used to return (row["col"], get(), keys()/items(), `in`, dict(row), **row,
+    == a dict) and like an object (row.col) for templates. Iterating or unpacking yields values.
+    Each column list gets its own subclass from _row_class() holding the name -> index mapping.
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        i = self._index.get(key)
+        return default if i is None else tuple.__getitem__(self, i)
+
+    def keys(self):
+        return self._index.keys()
+
+    def values(self):
+        return [tuple.__getitem__(self, i) for i in self._index.values()]
+
+    def items(self):
+        return [(name, tuple.__getitem__(self, i)) for name, i in self._index.items()]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return dict(self) == other
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = tuple.__hash__
+
+    def __reduce__(self):
+        return _make_row, (self._fields, tuple(self))
+
+    def __repr__(self):
+        return f"Row({dict(self)!r})"
+
+
+try:
+    from _collections import _tuplegetter  # the C attribute getter namedtuple uses
+except ImportError:
+    def _tuplegetter(index, doc):
+        return property(operator.itemgetter(index), doc=doc)
+
+_ROW_METHODS = frozenset(("get", "keys", "values", "items", "_fields", "_index"))
+
+
+@lru_cache(maxsize=1024)
+def _row_class(fields):
+    # Duplicate names (SELECT u.*, ui.id) resolve to the last column, as they did in the dict rows.
+    index = {name: i for i, name in enumerate(fields)}
+    attrs = {"__slots__": (), "_fields": fields, "_index": index}
+    for name, i in index.items():
+        if name not in _ROW_METHODS:
+            attrs[name] = _tuplegetter(i, None)
+    return type("Row", (Row,), attrs)
+
+
+def _make_row(fields, values):
+    return _row_class(fields)(values)
+
+
+def _row_type(cur):
+    return _row_class(tuple(column.name for column in cur.description))
+
+
 def query_one(sql, params=None):
-    conn = get_db()
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(sql, params)
+    conn = _read_db()
+    with conn.cursor() as cur:
+        _run(cur, sql, params)
         row = cur.fetchone()
-    return dict(row) if row else None
+        if row is not None:
+            row = _row_type(cur)(row)
+    _count(1 if row else 0)
+    return row
 
 
 def query_all(sql, params=None):
-    conn = get_db()
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(sql, params)
-        return [dict(r) for r in cur.fetchall()]
+    conn = _read_db()
+    with conn.cursor() as cur:
+        _run(cur, sql, params)
+        rows = cur.fetchall()
+        if rows:
+            rows = list(map(_row_type(cur), rows))
+    _count(len(rows))
+    return rows
+
+
+def query_tuples(sql, params=None):
+    """Rows as plain tuples in SELECT order (no per-row dict), for callers that build their own records."""
+    conn = _read_db()
+    with conn.cursor() as cur:
+        _run(cur, sql, params)
+        rows = cur.fetchall()
+    _count(len(rows))
+    return rows
+
+
+def query_iter(sql, params=None, fetch_size=None):
+    """
+    Rows as plain tuples, streamed through a named server-side cursor fetch_size
+    (QUERY_ITER_FETCH_SIZE) rows at a time, so memory stays flat however large the result.
+    A prepared() Statement runs as its plain SQL: DECLARE ... CURSOR cannot take an EXECUTE.
+    The cursor is WITH HOLD, so commit() between rows (batch jobs) does not end the scan. On an
+    autocommit connection the scan runs in its own transaction, ended once the rows are exhausted,
+    the iterator is closed, or the app context tears down.
+    """
+    rows = _iter_rows(sql, params, fetch_size or current_app.config.get("QUERY_ITER_FETCH_SIZE", 2000))
+    g.setdefault("db_iters", weakref.WeakSet()).add(rows)
+    return rows
+
+
+def _iter_rows(sql, params, fetch_size):
+    conn = _read_db()
+    opened = conn.autocommit
+    if opened:
+        # Without a transaction DECLARE ... WITH HOLD would materialize the whole result up front.
+        conn.autocommit = False
+        conn.streaming = True
+    cur = conn.cursor(f"query_iter_{next(_iter_names)}", withhold=True)
+    cur.itersize = fetch_size
+    fetched = 0
+    try:
+        cur.execute(sql.sql if isinstance(sql, Statement) else sql, params)
+        for row in cur:
+            fetched += 1
+            yield row
+    finally:
+        if not conn.closed:
+            cur.close()
+            if opened and conn.streaming:
+                conn.streaming = False
+                conn.commit()
+                conn.autocommit = True
+        _count(fetched)
 
 
 def execute(sql, params=None):
-    conn = get_db()
+    conn = _write_db()
     with conn.cursor() as cur:
-        cur.execute(sql, params)
+        _run(cur, sql, params)
+        _count(cur.rowcount)
         return cur.rowcount
 
 
 def execute_returning(sql, params=None):
-    conn = get_db()
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(sql, params)
+    conn = _write_db()
+    with conn.cursor() as cur:
+        _run(cur, sql, params)
         row = cur.fetchone()
-    return dict(row) if row else None
+        if row is not None:
+            row = _row_type(cur)(row)
+    _count(1 if row else 0)
+    return row
+
+
+def execute_values(sql, rows, template=None, page_size=1000, fetch=False):
+    """
+    Multi-row INSERT/UPDATE/upsert: `sql` holds one bare %s that becomes a VALUES list of up to
+    page_size rows per statement (psycopg2.extras.execute_values). Returns the total rowcount, or
+    with fetch=True the RETURNING rows as Rows.
+    """
+    rows = list(rows)
+    conn = _write_db()
+    total = 0
+    fetched = []
+    with conn.cursor() as cur:
+        for start in range(0, len(rows), page_size):
+            page = rows[start:start + page_size]
+            result = psycopg2.extras.execute_values(cur, sql, page, template, len(page), fetch)
+            if fetch:
+                fetched.extend(map(_row_type(cur), result))
+            total += cur.rowcount
+            _count(cur.rowcount)
+    return fetched if fetch else total
+
+
+def _copy_field(value):
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class _CopySource:
+    """File-like reader over `rows` in COPY text format, produced as copy_expert() asks for data."""
+
+    def __init__(self, rows):
+        self._lines = ("\t".join(map(_copy_field, row)) + "\n" for row in rows)
+        self._buffer = b""
+        self.rows = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line.encode("utf-8")
+            self.rows += 1
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def copy_rows(table, columns, rows):
+    """COPY an iterable of tuples into table(columns), consuming it lazily; returns the row count."""
+    conn = _write_db()
+    source = _CopySource(rows)
+    with conn.cursor() as cur:
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", source)
+    _count(source.rows)
+    return source.rows
 
 
 def commit():
     conn = g.get("db_conn")
     if conn:
         conn.commit()
+        conn.autocommit = _read_autocommit()
 
 
 def rollback():
     conn = g.get("db_conn")
     if conn:
         conn.rollback()
+        conn.autocommit = _read_autocommit()
 
 
 def to_obj(row):
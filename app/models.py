@@ -32,11 +32,13 @@ def make_user(row):
 
 @login_manager.user_loader
 def load_user(user_id):
-    from app.database import query_one
+    from app.database import query_one, prepared
     row = query_one(
-        "SELECT u.*, ui.filename AS pp_filename, ui.id AS pp_id "
-        "FROM users u LEFT JOIN user_images ui ON u.profile_picture_id = ui.id "
-        "WHERE u.id = %s",
+        prepared(
+            "SELECT u.*, ui.filename AS pp_filename, ui.id AS pp_id "
+            "FROM users u LEFT JOIN user_images ui ON u.profile_picture_id = ui.id "
+            "WHERE u.id = %s"
+        ),
         (int(user_id),),
     )
     return make_user(row)
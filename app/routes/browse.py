@@ -1,9 +1,11 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from app import cache
-from app.database import query_one, query_all, execute, execute_returning, commit
-from app.utils.fame import update_user_fame
-from app.utils.matching import get_suggestions, search_users, calculate_age
+from app.database import query_one, query_all, execute, execute_returning, commit, prepared
+from app.utils.blocks import is_blocked, invalidate_blocks
+from app.utils.fame import record_like, record_unlike, record_likes_removed
+from app.utils.matching import calculate_age
+from app.utils.suggestion_cache import ranked_page, invalidate_suggestions
 from app.utils.notifications import emit_notification
 
 browse_bp = Blueprint("browse", __name__)
@@ -11,9 +13,7 @@ browse_bp = Blueprint("browse", __name__)
 
 @cache.cached(timeout=600, key_prefix="all_tags")
 def get_all_tags():
-    from types import SimpleNamespace
-    rows = query_all("SELECT id, name FROM tags ORDER BY name LIMIT 100")
-    return [SimpleNamespace(**r) for r in rows]
+    return query_all("SELECT id, name FROM tags ORDER BY name LIMIT 100")
 
 
 PER_PAGE = 20
@@ -23,7 +23,9 @@ PER_PAGE = 20
 @browse_bp.route("/suggestions")
 @login_required
 def suggestions():
-    page = request.args.get("page", 1, type=int)
+    # Keyset pagination: `cursor` marks the last card of the previous page, `page` is display only.
+    cursor = request.args.get("cursor")
+    page = request.args.get("page", 1, type=int) if cursor else 1
     sort_by = request.args.get("sort", "score")
     filters = {
         "age_min": request.args.get("age_min"),
@@ -34,26 +36,26 @@ def suggestions():
         "tags": request.args.get("tags"),
     }
     filters = {k: v for k, v in filters.items() if v}
-    all_results = get_suggestions(current_user, sort_by=sort_by, filters=filters, limit=500)
-    total = len(all_results)
-    total_pages = (total + PER_PAGE - 1) // PER_PAGE
-    start = (page - 1) * PER_PAGE
-    end = start + PER_PAGE
-    results = all_results[start:end]
-    my_likes_rows = query_all("SELECT liked_id FROM likes WHERE liker_id = %s", (current_user.id,))
+    results, total, next_cursor = ranked_page(
+        current_user, sort_by=sort_by, filters=filters, limit=PER_PAGE, cursor=cursor,
+    )
+    my_likes_rows = query_all(
+        prepared("SELECT liked_id FROM likes WHERE liker_id = %s"), (current_user.id,)
+    )
     my_likes = set(r["liked_id"] for r in my_likes_rows)
     return render_template(
         "browse/suggestions.html",
         results=results, my_likes=my_likes, sort_by=sort_by,
         filters=filters, calculate_age=calculate_age,
-        page=page, total_pages=total_pages,
+        page=page, total=total, cursor=cursor, next_cursor=next_cursor,
     )
 
 
 @browse_bp.route("/search")
 @login_required
 def search():
-    page = request.args.get("page", 1, type=int)
+    cursor = request.args.get("cursor")
+    page = request.args.get("page", 1, type=int) if cursor else 1
     sort_by = request.args.get("sort", "score")
     filters = {
         "age_min": request.args.get("age_min"),
@@ -65,26 +67,32 @@ def search():
     }
     filters = {k: v for k, v in filters.items() if v}
     results = []
-    total_pages = 1
+    total = 0
+    next_cursor = None
     searched = any(filters.values())
     if searched:
-        all_results = search_users(current_user, filters=filters, sort_by=sort_by, limit=500)
-        total = len(all_results)
-        total_pages = (total + PER_PAGE - 1) // PER_PAGE
-        start = (page - 1) * PER_PAGE
-        end = start + PER_PAGE
-        results = all_results[start:end]
-    my_likes_rows = query_all("SELECT liked_id FROM likes WHERE liker_id = %s", (current_user.id,))
+        results, total, next_cursor = ranked_page(
+            current_user, sort_by=sort_by, filters=filters, limit=PER_PAGE, cursor=cursor,
+        )
+    my_likes_rows = query_all(
+        prepared("SELECT liked_id FROM likes WHERE liker_id = %s"), (current_user.id,)
+    )
     my_likes = set(r["liked_id"] for r in my_likes_rows)
     all_tags = get_all_tags()
     return render_template(
         "browse/search.html",
         results=results, my_likes=my_likes, sort_by=sort_by,
         filters=filters, searched=searched, all_tags=all_tags,
-        calculate_age=calculate_age, page=page, total_pages=total_pages,
+        calculate_age=calculate_age, page=page, total=total,
+        cursor=cursor, next_cursor=next_cursor,
     )
 
 
+def _lock_pair(user_a, user_b):
+    """Transaction lock on the unordered pair, taken before writing likes between the two users."""
+    execute("SELECT pg_advisory_xact_lock(%s, %s)", (min(user_a, user_b), max(user_a, user_b)))
+
+
 @browse_bp.route("/like/<int:user_id>", methods=["POST"])
 @login_required
 def like(user_id):
@@ -102,24 +110,22 @@ def like(user_id):
         flash("You cannot like a user without a profile picture.", "error")
         return redirect(url_for("profile.view", user_id=user_id))
     existing = query_one(
-        "SELECT id FROM likes WHERE liker_id=%s AND liked_id=%s", (current_user.id, user_id)
+        prepared("SELECT id FROM likes WHERE liker_id=%s AND liked_id=%s"), (current_user.id, user_id)
     )
     if existing:
         flash("You already liked this user.", "error")
         return redirect(url_for("profile.view", user_id=user_id))
-    blocked = query_one(
-        "SELECT id FROM blocks WHERE (blocker_id=%s AND blocked_id=%s) OR (blocker_id=%s AND blocked_id=%s)",
-        (user_id, current_user.id, current_user.id, user_id),
-    )
-    if blocked:
+    if is_blocked(current_user.id, user_id):
         flash("You cannot like this user.", "error")
         return redirect(url_for("browse.suggestions"))
-    execute(
-        "INSERT INTO likes (liker_id, liked_id) VALUES (%s, %s)", (current_user.id, user_id)
-    )
-    they_liked = query_one(
-        "SELECT id FROM likes WHERE liker_id=%s AND liked_id=%s", (user_id, current_user.id)
-    )
+    # Reciprocal likes serialize on the pair, so the second one always sees the first as a match.
+    _lock_pair(current_user.id, user_id)
+    they_liked = execute_returning(
+        "INSERT INTO likes (liker_id, liked_id) VALUES (%s, %s) "
+        "RETURNING EXISTS (SELECT 1 FROM likes WHERE liker_id = %s AND liked_id = %s) AS is_match",
+        (current_user.id, user_id, user_id, current_user.id),
+    )["is_match"]
+    record_like(current_user.id, user_id, they_liked)
     if they_liked:
         execute(
             "INSERT INTO notifications (user_id, type, related_user_id) VALUES (%s, 'match', %s)",
@@ -140,8 +146,7 @@ def like(user_id):
         commit()
         emit_notification(user_id, "like", current_user)
         flash("You liked this user.", "success")
-    update_user_fame(user_id)
-    update_user_fame(current_user.id)
+    invalidate_suggestions(current_user.id, user_id)
     return redirect(url_for("profile.view", user_id=user_id))
 
 
@@ -151,15 +156,23 @@ def unlike(user_id):
     if user_id == current_user.id:
         return redirect(url_for("browse.suggestions"))
     existing = query_one(
-        "SELECT id FROM likes WHERE liker_id=%s AND liked_id=%s", (current_user.id, user_id)
+        prepared("SELECT id FROM likes WHERE liker_id=%s AND liked_id=%s"), (current_user.id, user_id)
     )
     if not existing:
         flash("You have not liked this user.", "error")
         return redirect(url_for("profile.view", user_id=user_id))
-    was_match = query_one(
-        "SELECT id FROM likes WHERE liker_id=%s AND liked_id=%s", (user_id, current_user.id)
-    ) is not None
-    execute("DELETE FROM likes WHERE liker_id=%s AND liked_id=%s", (current_user.id, user_id))
+    _lock_pair(current_user.id, user_id)
+    removed = execute_returning(
+        "DELETE FROM likes WHERE liker_id = %s AND liked_id = %s "
+        "RETURNING EXISTS (SELECT 1 FROM likes WHERE liker_id = %s AND liked_id = %s) AS was_match",
+        (current_user.id, user_id, user_id, current_user.id),
+    )
+    if not removed:
+        commit()
+        flash("You have not liked this user.", "error")
+        return redirect(url_for("profile.view", user_id=user_id))
+    was_match = removed["was_match"]
+    record_unlike(current_user.id, user_id, was_match)
     commit()
     if was_match:
         execute(
@@ -168,8 +181,7 @@ def unlike(user_id):
         )
         commit()
         emit_notification(user_id, "unlike", current_user)
-    update_user_fame(user_id)
-    update_user_fame(current_user.id)
+    invalidate_suggestions(current_user.id, user_id)
     flash("You unliked this user.", "success")
     return redirect(url_for("profile.view", user_id=user_id))
 
@@ -190,9 +202,13 @@ def block(user_id):
         flash("User already blocked.", "error")
         return redirect(url_for("browse.suggestions"))
     execute("INSERT INTO blocks (blocker_id, blocked_id) VALUES (%s, %s)", (current_user.id, user_id))
-    execute("DELETE FROM likes WHERE liker_id=%s AND liked_id=%s", (current_user.id, user_id))
-    execute("DELETE FROM likes WHERE liker_id=%s AND liked_id=%s", (user_id, current_user.id))
+    _lock_pair(current_user.id, user_id)
+    i_liked = execute("DELETE FROM likes WHERE liker_id=%s AND liked_id=%s", (current_user.id, user_id))
+    they_liked = execute("DELETE FROM likes WHERE liker_id=%s AND liked_id=%s", (user_id, current_user.id))
+    record_likes_removed(current_user.id, user_id, i_liked, they_liked)
     commit()
+    invalidate_blocks(current_user.id, user_id)
+    invalidate_suggestions(current_user.id, user_id)
     flash("User blocked.", "success")
     return redirect(url_for("browse.suggestions"))
 
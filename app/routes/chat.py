@@ -4,7 +4,8 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from flask_socketio import emit, join_room, leave_room
 from app import socketio
-from app.database import query_one, query_all, execute, execute_returning, commit
+from app.database import query_one, query_all, execute, execute_returning, commit, prepared
+from app.utils.blocks import get_block_set, is_blocked
 
 chat_bp = Blueprint("chat", __name__)
 
@@ -19,13 +20,14 @@ def get_matches(user_id):
         "  SELECT l1.liked_id FROM likes l1 "
         "  JOIN likes l2 ON l1.liker_id = l2.liked_id AND l1.liked_id = l2.liker_id "
         "  WHERE l1.liker_id = %s"
-        ") "
-        "AND u.id NOT IN (SELECT blocked_id FROM blocks WHERE blocker_id = %s) "
-        "AND u.id NOT IN (SELECT blocker_id FROM blocks WHERE blocked_id = %s)",
-        (user_id, user_id, user_id),
+        ")",
+        (user_id,),
     )
+    blocked = get_block_set(user_id)
     result = []
     for r in rows:
+        if r["id"] in blocked:
+            continue
         pp = SimpleNamespace(filename=r["pp_filename"]) if r.get("pp_filename") else None
         user = SimpleNamespace(
             id=r["id"], username=r["username"], first_name=r["first_name"],
@@ -38,23 +40,16 @@ def get_matches(user_id):
 
 def is_match(user1_id, user2_id):
     r = query_one(
-        "SELECT 1 FROM likes l1 JOIN likes l2 "
-        "ON l1.liker_id = l2.liked_id AND l1.liked_id = l2.liker_id "
-        "WHERE l1.liker_id = %s AND l1.liked_id = %s",
+        prepared(
+            "SELECT 1 FROM likes l1 JOIN likes l2 "
+            "ON l1.liker_id = l2.liked_id AND l1.liked_id = l2.liker_id "
+            "WHERE l1.liker_id = %s AND l1.liked_id = %s"
+        ),
         (user1_id, user2_id),
     )
     return r is not None
 
 
-def is_blocked(user1_id, user2_id):
-    r = query_one(
-        "SELECT id FROM blocks WHERE "
-        "(blocker_id=%s AND blocked_id=%s) OR (blocker_id=%s AND blocked_id=%s)",
-        (user1_id, user2_id, user2_id, user1_id),
-    )
-    return r is not None
-
-
 def get_conversation(user1_id, user2_id, limit=100):
     rows = query_all(
         "SELECT * FROM messages WHERE "
@@ -62,12 +57,15 @@ def get_conversation(user1_id, user2_id, limit=100):
         "ORDER BY created_at DESC LIMIT %s",
         (user1_id, user2_id, user2_id, user1_id, limit),
     )
-    return [SimpleNamespace(**r) for r in reversed(rows)]
+    return rows[::-1]
 
 
 def get_unread_count(user_id, from_user_id):
     r = query_one(
-        "SELECT COUNT(*) AS cnt FROM messages WHERE sender_id=%s AND receiver_id=%s AND is_read=false",
+        prepared(
+            "SELECT COUNT(*) AS cnt FROM messages "
+            "WHERE sender_id=%s AND receiver_id=%s AND is_read=false"
+        ),
         (from_user_id, user_id),
     )
     return r["cnt"]
@@ -80,13 +78,12 @@ def index():
     matches_data = []
     for m in matches:
         unread = get_unread_count(current_user.id, m.id)
-        last_msg_row = query_one(
+        last_msg = query_one(
             "SELECT * FROM messages WHERE "
             "(sender_id=%s AND receiver_id=%s) OR (sender_id=%s AND receiver_id=%s) "
             "ORDER BY created_at DESC LIMIT 1",
             (current_user.id, m.id, m.id, current_user.id),
         )
-        last_msg = SimpleNamespace(**last_msg_row) if last_msg_row else None
         matches_data.append({"user": m, "unread": unread, "last_message": last_msg})
     matches_data.sort(
         key=lambda x: x["last_message"].created_at if x["last_message"] else datetime.min,
@@ -186,7 +183,7 @@ def send_message():
 @login_required
 def unread_count():
     r = query_one(
-        "SELECT COUNT(*) AS cnt FROM messages WHERE receiver_id=%s AND is_read=false",
+        prepared("SELECT COUNT(*) AS cnt FROM messages WHERE receiver_id=%s AND is_read=false"),
         (current_user.id,),
     )
     return jsonify({"count": r["cnt"]})
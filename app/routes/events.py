@@ -2,7 +2,8 @@ from datetime import datetime, timezone
 from types import SimpleNamespace
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
-from app.database import query_one, query_all, execute, execute_returning, commit
+from app.database import query_one, query_all, execute, execute_returning, commit, prepared
+from app.utils.blocks import is_blocked
 from app.utils.security import sanitize_string
 from app.utils.notifications import emit_notification
 
@@ -11,9 +12,11 @@ events_bp = Blueprint("events", __name__)
 
 def are_matched(user1_id, user2_id):
     r = query_one(
-        "SELECT 1 FROM likes l1 JOIN likes l2 "
-        "ON l1.liker_id = l2.liked_id AND l1.liked_id = l2.liker_id "
-        "WHERE l1.liker_id = %s AND l1.liked_id = %s",
+        prepared(
+            "SELECT 1 FROM likes l1 JOIN likes l2 "
+            "ON l1.liker_id = l2.liked_id AND l1.liked_id = l2.liker_id "
+            "WHERE l1.liker_id = %s AND l1.liked_id = %s"
+        ),
         (user1_id, user2_id),
     )
     return r is not None
@@ -26,8 +29,8 @@ def _load_events(sql, params):
         creator = query_one("SELECT id, first_name, username FROM users WHERE id = %s", (r["creator_id"],))
         invitee = query_one("SELECT id, first_name, username FROM users WHERE id = %s", (r["invitee_id"],))
         ev = SimpleNamespace(**r)
-        ev.creator = SimpleNamespace(**creator) if creator else None
-        ev.invitee = SimpleNamespace(**invitee) if invitee else None
+        ev.creator = creator
+        ev.invitee = invitee
         events.append(ev)
     return events
 
@@ -52,17 +55,11 @@ def create(user_id):
     if user_id == current_user.id:
         flash("You cannot create an event with yourself.", "error")
         return redirect(url_for("events.index"))
-    user_row = query_one("SELECT id, first_name, username FROM users WHERE id = %s", (user_id,))
-    if not user_row:
+    user = query_one("SELECT id, first_name, username FROM users WHERE id = %s", (user_id,))
+    if not user:
         flash("User not found.", "error")
         return redirect(url_for("events.index"))
-    user = SimpleNamespace(**user_row)
-    blocked = query_one(
-        "SELECT id FROM blocks WHERE "
-        "(blocker_id=%s AND blocked_id=%s) OR (blocker_id=%s AND blocked_id=%s)",
-        (current_user.id, user_id, user_id, current_user.id),
-    )
-    if blocked:
+    if is_blocked(current_user.id, user_id):
         flash("Cannot create event with this user.", "error")
         return redirect(url_for("events.index"))
     if not are_matched(current_user.id, user_id):
@@ -114,8 +111,8 @@ def view(event_id):
         return redirect(url_for("events.index"))
     creator = query_one("SELECT id, first_name, username FROM users WHERE id = %s", (event.creator_id,))
     invitee = query_one("SELECT id, first_name, username FROM users WHERE id = %s", (event.invitee_id,))
-    event.creator = SimpleNamespace(**creator) if creator else None
-    event.invitee = SimpleNamespace(**invitee) if invitee else None
+    event.creator = creator
+    event.invitee = invitee
     other_user = event.invitee if event.creator_id == current_user.id else event.creator
     is_creator = event.creator_id == current_user.id
     return render_template("events/view.html", event=event, other_user=other_user, is_creator=is_creator)
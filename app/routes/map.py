@@ -1,10 +1,14 @@
 from flask import Blueprint, render_template, jsonify
 from flask_login import login_required, current_user
 from app.database import query_all
+from app.utils.blocks import not_blocked_sql
+from app.utils.geocell import collect_by_rings
 from app.utils.matching import calculate_age
 
 map_bp = Blueprint("map", __name__)
 
+MAP_USERS_LIMIT = 200
+
 
 @map_bp.route("/")
 @login_required
@@ -15,7 +19,7 @@ def index():
 @map_bp.route("/users")
 @login_required
 def users_json():
-    rows = query_all(
+    sql = (
         "SELECT u.id, u.username, u.first_name, u.birth_date, u.latitude, u.longitude, "
         "u.is_online, ui.filename AS photo "
         "FROM users u "
@@ -23,11 +27,23 @@ def users_json():
         "WHERE u.email_verified = true AND u.latitude IS NOT NULL AND u.longitude IS NOT NULL "
         "AND (u.location_enabled = true OR btrim(COALESCE(u.location_place, '')) <> '') "
         "AND u.id != %s "
-        "AND u.id NOT IN (SELECT blocked_id FROM blocks WHERE blocker_id = %s) "
-        "AND u.id NOT IN (SELECT blocker_id FROM blocks WHERE blocked_id = %s) "
-        "LIMIT 200",
-        (current_user.id, current_user.id, current_user.id),
+        f"AND {not_blocked_sql()} "
     )
+    params = [current_user.id, current_user.id, current_user.id]
+    if current_user.latitude is None or current_user.longitude is None:
+        rows = query_all(sql + "LIMIT %s", params + [MAP_USERS_LIMIT])
+    else:
+        # Nearest grid rings first, so the 200 markers are the ones around the viewer.
+        rows = collect_by_rings(
+            lambda cells, remaining: query_all(
+                sql + "AND u.geo_cell = ANY(%s) LIMIT %s", params + [cells, remaining]
+            ),
+            lambda scanned, remaining: query_all(
+                sql + "AND (u.geo_cell IS NULL OR NOT (u.geo_cell = ANY(%s))) LIMIT %s",
+                params + [scanned, remaining],
+            ),
+            current_user.latitude, current_user.longitude, MAP_USERS_LIMIT,
+        )
     result = []
     for r in rows:
         result.append({
@@ -0,0 +1,22 @@
+from flask import Blueprint, jsonify, current_app, abort
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/")
+def index():
+    # Process-local counters for tuning caches and pools; off unless METRICS_ENABLED is set.
+    if not current_app.config.get("METRICS_ENABLED"):
+        abort(404)
+    from app.utils.suggestion_cache import get_cache_stats
+    from app.utils.scoring_pool import get_pool_stats
+    from app.database import pool_stats, hold_stats, routing_stats
+    tag_index = current_app.extensions.get("tag_index")
+    return jsonify({
+        "suggestions_cache": get_cache_stats(),
+        "tag_index": tag_index.stats() if tag_index else None,
+        "scoring_pool": get_pool_stats(),
+        "db_pool": pool_stats(),
+        "db_hold": hold_stats(),
+        "db_routing": routing_stats(),
+    })
@@ -1,7 +1,7 @@
 from types import SimpleNamespace
 from flask import Blueprint, render_template, jsonify, request
 from flask_login import login_required, current_user
-from app.database import query_one, query_all, execute, commit
+from app.database import query_one, query_all, execute, commit, prepared
 
 notifications_bp = Blueprint("notifications", __name__)
 
@@ -62,7 +62,7 @@ def index():
 @login_required
 def count():
     r = query_one(
-        "SELECT COUNT(*) AS cnt FROM notifications WHERE user_id=%s AND is_read=false",
+        prepared("SELECT COUNT(*) AS cnt FROM notifications WHERE user_id=%s AND is_read=false"),
         (current_user.id,),
     )
     return jsonify({"count": r["cnt"]})
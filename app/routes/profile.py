@@ -2,14 +2,20 @@ from datetime import date, datetime, timezone
 from types import SimpleNamespace
 from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_required, current_user
-from app.database import query_one, query_all, execute, execute_returning, commit
+from app.database import (
+    query_one, query_all, execute, execute_returning, execute_values, commit, prepared,
+)
 from app.models import make_user
 from app.utils.security import sanitize_string
 from app.utils.images import save_image, delete_image_file
-from app.utils.fame import update_user_fame
+from app.utils.blocks import is_blocked
+from app.utils.fame import record_view
+from app.utils.geocell import cell_key
+from app.utils.tag_index import update_user_tags
+from app.utils.suggestion_cache import invalidate_suggestions, invalidate_all_suggestions
 from app.utils.matching import calculate_age, haversine_distance
 from app.utils.notifications import emit_notification
-from app.utils.tags import canonical_tag_name, split_tags_input
+from app.utils.tags import canonical_tag_name, split_tags_input, tag_mask, mask_to_bits
 from app.utils.reverse_geocode import reverse_geocode_neighborhood, geocode_place_to_coordinates
 
 profile_bp = Blueprint("profile", __name__)
@@ -28,30 +34,34 @@ def get_user_tags(user_id):
 
 def set_user_tags(user_id, tag_names):
     execute("DELETE FROM user_tags WHERE user_id = %s", (user_id,))
-    seen = set()
+    seen = []
     for raw in tag_names[:MAX_TAGS]:
         name = canonical_tag_name(raw)
-        if not name or name in seen:
-            continue
-        seen.add(name)
-        tag = query_one("SELECT id FROM tags WHERE name = %s", (name,))
-        if not tag:
-            tag = execute_returning("INSERT INTO tags (name) VALUES (%s) RETURNING id", (name,))
-        execute(
-            "INSERT INTO user_tags (user_id, tag_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-            (user_id, tag["id"]),
+        if name and name not in seen:
+            seen.append(name)
+    tag_ids = []
+    if seen:
+        execute_values(
+            "INSERT INTO tags (name) VALUES %s ON CONFLICT (name) DO NOTHING", [(n,) for n in seen]
+        )
+        tag_ids = [r["id"] for r in query_all("SELECT id FROM tags WHERE name = ANY(%s)", (seen,))]
+        execute_values(
+            "INSERT INTO user_tags (user_id, tag_id) VALUES %s ON CONFLICT DO NOTHING",
+            [(user_id, tag_id) for tag_id in tag_ids],
         )
+    execute(
+        "UPDATE users SET tag_mask = CAST(%s AS bit varying) WHERE id = %s",
+        (mask_to_bits(tag_mask(tag_ids)), user_id),
+    )
     commit()
+    update_user_tags(user_id, seen)
+    invalidate_suggestions(user_id)
 
 
 def _render_profile_edit(user):
-    imgs = [
-        SimpleNamespace(**r)
-        for r in query_all(
-            "SELECT * FROM user_images WHERE user_id = %s ORDER BY upload_order",
-            (user.id,),
-        )
-    ]
+    imgs = query_all(
+        "SELECT * FROM user_images WHERE user_id = %s ORDER BY upload_order", (user.id,)
+    )
     return render_template(
         "profile/edit.html",
         user=user,
@@ -117,6 +127,7 @@ def edit():
             ),
         )
         commit()
+        invalidate_suggestions(user.id)
         tag_names = split_tags_input(tags_raw)
         set_user_tags(user.id, tag_names)
         flash("Profile updated.", "success")
@@ -184,6 +195,8 @@ def delete_image(image_id):
                 (next_img["id"], current_user.id),
             )
     commit()
+    # Other viewers' cached suggestions may still point at the deleted file.
+    invalidate_all_suggestions()
     upload_folder = current_app.config.get("UPLOAD_FOLDER", "./app/uploads")
     delete_image_file(img["filename"], upload_folder)
     flash("Image deleted.", "success")
@@ -238,10 +251,12 @@ def update_location():
         lat, lng = coords
         fp = place[:200]
         execute(
-            "UPDATE users SET latitude=%s, longitude=%s, location_enabled=false, location_place=%s WHERE id=%s",
-            (lat, lng, fp, current_user.id),
+            "UPDATE users SET latitude=%s, longitude=%s, geo_cell=%s, location_enabled=false, "
+            "location_place=%s WHERE id=%s",
+            (lat, lng, cell_key(lat, lng), fp, current_user.id),
         )
         commit()
+        invalidate_suggestions(current_user.id)
         return jsonify({"success": True, "place": fp, "latitude": lat, "longitude": lng})
 
     if lat is None or lng is None:
@@ -252,8 +267,8 @@ def update_location():
         if not (-90 <= lat <= 90 and -180 <= lng <= 180):
             return jsonify({"success": False, "error": "Invalid coordinates"}), 400
         execute(
-            "UPDATE users SET latitude=%s, longitude=%s, location_enabled=true WHERE id=%s",
-            (lat, lng, current_user.id),
+            "UPDATE users SET latitude=%s, longitude=%s, geo_cell=%s, location_enabled=true WHERE id=%s",
+            (lat, lng, cell_key(lat, lng), current_user.id),
         )
         resolved = reverse_geocode_neighborhood(lat, lng)
         resolved = (resolved or "").strip() or None
@@ -265,6 +280,7 @@ def update_location():
                 (fp, current_user.id),
             )
         commit()
+        invalidate_suggestions(current_user.id)
         return jsonify({"success": True, "place": final_place, "latitude": lat, "longitude": lng})
     except (ValueError, TypeError):
         pass
@@ -289,45 +305,38 @@ def view(user_id):
     if not user.email_verified:
         flash("User not found.", "error")
         return redirect(url_for("browse.suggestions"))
-    i_blocked = query_one(
-        "SELECT id FROM blocks WHERE blocker_id=%s AND blocked_id=%s",
-        (current_user.id, user.id),
-    )
-    if i_blocked:
-        flash("You have blocked this user.", "error")
-        return redirect(url_for("browse.suggestions"))
-    they_blocked = query_one(
-        "SELECT id FROM blocks WHERE blocker_id=%s AND blocked_id=%s",
-        (user.id, current_user.id),
-    )
-    if they_blocked:
-        flash("User not found.", "error")
+    if is_blocked(current_user.id, user.id):
+        i_blocked = query_one(
+            "SELECT id FROM blocks WHERE blocker_id=%s AND blocked_id=%s",
+            (current_user.id, user.id),
+        )
+        if i_blocked:
+            flash("You have blocked this user.", "error")
+        else:
+            flash("User not found.", "error")
         return redirect(url_for("browse.suggestions"))
     now = datetime.now(timezone.utc).replace(tzinfo=None)
     execute(
         "INSERT INTO profile_views (viewer_id, viewed_id, viewed_at) VALUES (%s, %s, %s)",
         (current_user.id, user.id, now),
     )
+    # fame_rating was loaded before the profile_views insert; take the value the counter update returns
+    user.fame_rating = record_view(user.id)
     execute(
         "INSERT INTO notifications (user_id, type, related_user_id) VALUES (%s, 'view', %s)",
         (user.id, current_user.id),
     )
     commit()
     emit_notification(user.id, "view", current_user)
-    # fame_rating was loaded before profile_views insert; refresh so the page shows current value
-    user.fame_rating = update_user_fame(user.id)
-    images = [
-        SimpleNamespace(**r)
-        for r in query_all(
-            "SELECT * FROM user_images WHERE user_id = %s ORDER BY upload_order", (user.id,)
-        )
-    ]
+    images = query_all(
+        "SELECT * FROM user_images WHERE user_id = %s ORDER BY upload_order", (user.id,)
+    )
     tags = get_user_tags(user.id)
     i_liked = query_one(
-        "SELECT id FROM likes WHERE liker_id=%s AND liked_id=%s", (current_user.id, user.id)
+        prepared("SELECT id FROM likes WHERE liker_id=%s AND liked_id=%s"), (current_user.id, user.id)
     ) is not None
     they_liked = query_one(
-        "SELECT id FROM likes WHERE liker_id=%s AND liked_id=%s", (user.id, current_user.id)
+        prepared("SELECT id FROM likes WHERE liker_id=%s AND liked_id=%s"), (user.id, current_user.id)
     ) is not None
     is_match = i_liked and they_liked
     age = calculate_age(user.birth_date)
@@ -394,7 +403,9 @@ def likes():
             profile_picture=pp,
         )
         likes_list.append((like, liker))
-    my_likes_rows = query_all("SELECT liked_id FROM likes WHERE liker_id = %s", (current_user.id,))
+    my_likes_rows = query_all(
+        prepared("SELECT liked_id FROM likes WHERE liker_id = %s"), (current_user.id,)
+    )
     my_likes = set(r["liked_id"] for r in my_likes_rows)
     return render_template("profile/likes.html", likes=likes_list, my_likes=my_likes)
 
@@ -412,14 +423,17 @@ def reorder_images():
         "SELECT id FROM user_images WHERE user_id = %s", (current_user.id,)
     )
     valid_ids = {r["id"] for r in images}
-    for idx, img_id in enumerate(order):
-        if img_id in valid_ids:
-            execute(
-                "UPDATE user_images SET upload_order=%s, is_profile_picture=%s WHERE id=%s",
-                (idx, idx == 0, img_id),
-            )
-            if idx == 0:
-                execute("UPDATE users SET profile_picture_id=%s WHERE id=%s", (img_id, current_user.id))
+    # Last position wins when an id repeats, as with one UPDATE per entry.
+    positions = {img_id: idx for idx, img_id in enumerate(order) if img_id in valid_ids}
+    if positions:
+        execute_values(
+            "UPDATE user_images AS ui SET upload_order = v.upload_order, "
+            "is_profile_picture = v.is_profile_picture "
+            "FROM (VALUES %s) AS v (id, upload_order, is_profile_picture) WHERE ui.id = v.id",
+            [(img_id, idx, idx == 0) for img_id, idx in positions.items()],
+        )
+    if order and order[0] in valid_ids:
+        execute("UPDATE users SET profile_picture_id=%s WHERE id=%s", (order[0], current_user.id))
     commit()
     return jsonify({"success": True})
 
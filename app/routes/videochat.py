@@ -3,7 +3,8 @@ from flask import Blueprint, render_template, redirect, url_for, flash
 from flask_login import login_required, current_user
 from flask_socketio import emit, join_room, leave_room
 from app import socketio
-from app.database import query_one
+from app.database import query_one, prepared
+from app.utils.blocks import is_blocked
 
 videochat_bp = Blueprint("videochat", __name__)
 
@@ -12,23 +13,16 @@ active_calls = {}
 
 def are_matched(user1_id, user2_id):
     r = query_one(
-        "SELECT 1 FROM likes l1 JOIN likes l2 "
-        "ON l1.liker_id = l2.liked_id AND l1.liked_id = l2.liker_id "
-        "WHERE l1.liker_id = %s AND l1.liked_id = %s",
+        prepared(
+            "SELECT 1 FROM likes l1 JOIN likes l2 "
+            "ON l1.liker_id = l2.liked_id AND l1.liked_id = l2.liker_id "
+            "WHERE l1.liker_id = %s AND l1.liked_id = %s"
+        ),
         (user1_id, user2_id),
     )
     return r is not None
 
 
-def _is_blocked(user1_id, user2_id):
-    r = query_one(
-        "SELECT id FROM blocks WHERE "
-        "(blocker_id=%s AND blocked_id=%s) OR (blocker_id=%s AND blocked_id=%s)",
-        (user1_id, user2_id, user2_id, user1_id),
-    )
-    return r is not None
-
-
 @videochat_bp.route("/call/<int:user_id>")
 @login_required
 def call(user_id):
@@ -45,7 +39,7 @@ def call(user_id):
     if not user_row:
         flash("User not found.", "error")
         return redirect(url_for("chat.index"))
-    if _is_blocked(current_user.id, user_id):
+    if is_blocked(current_user.id, user_id):
         flash("Cannot call this user.", "error")
         return redirect(url_for("chat.index"))
     if not are_matched(current_user.id, user_id):
@@ -102,12 +96,18 @@ def handle_ice_candidate(data):
 
 @socketio.on("call_request")
 def handle_call_request(data):
-    target_user_id = data.get("target_user_id")
-    caller_id = data.get("caller_id")
+    if not current_user.is_authenticated:
+        return
+    try:
+        target_user_id = int(data.get("target_user_id"))
+    except (TypeError, ValueError):
+        return
+    if is_blocked(current_user.id, target_user_id):
+        return
     caller_name = data.get("caller_name")
     room = data.get("room")
     emit("incoming_call", {
-        "caller_id": caller_id,
+        "caller_id": current_user.id,
         "caller_name": caller_name,
         "room": room,
     }, room=f"user_{target_user_id}")
@@ -0,0 +1,41 @@
+"""Block relationships: a cached per-user set for point checks, NOT EXISTS anti-joins for queries.
+
+get_block_set(user_id) holds every user that `user_id` blocked or was blocked by. It lives in the
+app cache for BLOCK_CACHE_TTL seconds and browse.block drops it for both users. With a per-process
+CACHE_TYPE (SimpleCache) other workers see a new block only once their copy expires.
+"""
+
+from flask import current_app
+from app import cache
+from app.database import query_all
+
+
+def not_blocked_sql(user_col="u.id"):
+    """WHERE fragment excluding block relations with the viewer; takes the viewer id twice."""
+    return (
+        f"NOT EXISTS (SELECT 1 FROM blocks b WHERE b.blocker_id = %s AND b.blocked_id = {user_col}) "
+        f"AND NOT EXISTS (SELECT 1 FROM blocks b WHERE b.blocked_id = %s AND b.blocker_id = {user_col})"
+    )
+
+
+def get_block_set(user_id):
+    key = f"blocks:{user_id}"
+    blocked = cache.get(key)
+    if blocked is None:
+        rows = query_all(
+            "SELECT blocked_id AS id FROM blocks WHERE blocker_id = %s "
+            "UNION SELECT blocker_id FROM blocks WHERE blocked_id = %s",
+            (user_id, user_id),
+        )
+        blocked = frozenset(r["id"] for r in rows)
+        cache.set(key, blocked, timeout=current_app.config.get("BLOCK_CACHE_TTL", 300))
+    return blocked
+
+
+def is_blocked(user1_id, user2_id):
+    """Whether either user blocked the other."""
+    return user2_id in get_block_set(user1_id)
+
+
+def invalidate_blocks(*user_ids):
+    cache.delete_many(*[f"blocks:{uid}" for uid in user_ids])
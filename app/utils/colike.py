@@ -0,0 +1,84 @@
+"""Co-like neighbours: "people who liked X also liked Y".
+
+`flask build-colike` computes, for every liked user X, the users Y most often liked by the same
+likers (cosine similarity of their liker sets, i.e. the sparse product likes^T * likes) and keeps
+the top COLIKE_NEIGHBOURS per X in user_similar. At request time colike_points() sums those
+neighbour scores over everyone the viewer liked, and the ranking engines add
+COLIKE_WEIGHT * points to each candidate's score (COLIKE_WEIGHT=0 leaves suggestions unchanged).
+"""
+
+from flask import current_app
+from app.database import query_one, query_all, query_tuples, execute, commit, rollback, pin_primary
+
+# Arbitrary advisory lock key so only one process rebuilds user_similar at a time.
+_BUILD_LOCK_KEY = 5_410_328
+
+# Points per candidate for the viewer in %s: (similar_id, points).
+COLIKE_POINTS_SQL = (
+    "SELECT s.similar_id, SUM(s.score)::int AS points FROM likes l "
+    "JOIN user_similar s ON s.user_id = l.liked_id WHERE l.liker_id = %s GROUP BY s.similar_id"
+)
+
+
+def colike_weight():
+    return int(current_app.config.get("COLIKE_WEIGHT", 0))
+
+
+def colike_points(user_id):
+    """{candidate id: summed similarity points} over the neighbours of every user `user_id` liked."""
+    return dict(query_tuples(COLIKE_POINTS_SQL, (user_id,)))
+
+
+def build_colike_neighbours(top_n=None, chunk_size=1000):
+    """
+    Rebuild user_similar: for each liked user, the top_n users sharing the most likers, scored as
+    round(100 * co-likers / sqrt(likers(X) * likers(Y))). Liked users are processed chunk_size at a
+    time, each chunk replaced in its own transaction so readers never see a half-built list.
+    Returns the number of users with neighbours, or None when another build is running.
+    """
+    top_n = top_n or current_app.config.get("COLIKE_NEIGHBOURS", 50)
+    pin_primary()  # session advisory lock and temp table live on the primary connection
+    if not query_one("SELECT pg_try_advisory_lock(%s) AS ok", (_BUILD_LOCK_KEY,))["ok"]:
+        commit()
+        return None
+    try:
+        execute(
+            "CREATE TEMP TABLE IF NOT EXISTS colike_degree (user_id INTEGER PRIMARY KEY, likers INTEGER)"
+        )
+        execute("TRUNCATE colike_degree")
+        execute("INSERT INTO colike_degree SELECT liked_id, COUNT(*) FROM likes GROUP BY liked_id")
+        commit()
+        liked = [r["user_id"] for r in query_all("SELECT user_id FROM colike_degree ORDER BY user_id")]
+        for start in range(0, len(liked), chunk_size):
+            chunk = liked[start:start + chunk_size]
+            execute("DELETE FROM user_similar WHERE user_id = ANY(%s)", (chunk,))
+            execute(
+                "INSERT INTO user_similar (user_id, similar_id, score) "
+                "SELECT user_id, similar_id, score FROM ("
+                "SELECT a.liked_id AS user_id, b.liked_id AS similar_id, "
+                "round(100 * COUNT(*) / sqrt(da.likers::float8 * db.likers))::int AS score, "
+                "row_number() OVER (PARTITION BY a.liked_id "
+                "ORDER BY COUNT(*) / sqrt(da.likers::float8 * db.likers) DESC, b.liked_id) AS rank "
+                "FROM likes a JOIN likes b ON b.liker_id = a.liker_id AND b.liked_id <> a.liked_id "
+                "JOIN colike_degree da ON da.user_id = a.liked_id "
+                "JOIN colike_degree db ON db.user_id = b.liked_id "
+                "WHERE a.liked_id = ANY(%s) "
+                "GROUP BY a.liked_id, b.liked_id, da.likers, db.likers"
+                ") ranked WHERE rank <= %s AND score > 0",
+                (chunk, top_n),
+            )
+            commit()
+        # Users nobody likes any more keep no neighbours.
+        execute(
+            "DELETE FROM user_similar s "
+            "WHERE NOT EXISTS (SELECT 1 FROM colike_degree d WHERE d.user_id = s.user_id)"
+        )
+        execute("DROP TABLE colike_degree")
+        commit()
+        return query_one("SELECT COUNT(DISTINCT user_id) AS cnt FROM user_similar")["cnt"]
+    except Exception:
+        rollback()
+        raise
+    finally:
+        query_one("SELECT pg_advisory_unlock(%s) AS ok", (_BUILD_LOCK_KEY,))
+        commit()
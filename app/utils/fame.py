@@ -1,4 +1,14 @@
-from app.database import query_one, execute, commit
+import threading
+import time
+from flask import current_app
+from app.database import query_one, query_all, execute, execute_returning, commit, pin_primary
+
+LIKE_POINTS = 10
+VIEW_POINTS = 1
+CONNECTION_POINTS = 20
+
+# Arbitrary advisory lock key so only one process runs the batch recompute at a time.
+_BATCH_LOCK_KEY = 5_410_327
 
 
 def calculate_fame_rating(user_id):
@@ -10,12 +20,177 @@ def calculate_fame_rating(user_id):
         "WHERE l1.liker_id = %s",
         (user_id,),
     )
-    rating = (likes["cnt"] * 10) + (views["cnt"] * 1) + (connections["cnt"] * 20)
+    rating = (
+        (likes["cnt"] * LIKE_POINTS) + (views["cnt"] * VIEW_POINTS)
+        + (connections["cnt"] * CONNECTION_POINTS)
+    )
     return rating
 
 
+def _batch_mode():
+    return current_app.config.get("FAME_MODE", "incremental") == "batch"
+
+
+def _bump(user_id, likes=0, views=0, connections=0):
+    if _batch_mode():
+        # Batch mode: only flag the user; recompute_fame() rewrites counters and rating later.
+        return execute_returning(
+            "UPDATE users SET fame_dirty = true WHERE id = %s RETURNING fame_rating", (user_id,)
+        )
+    # SET expressions all see the old row, so fame_rating is computed from the adjusted counters.
+    return execute_returning(
+        "UPDATE users SET likes_received = likes_received + %(likes)s, "
+        "views_received = views_received + %(views)s, connections = connections + %(connections)s, "
+        f"fame_rating = (likes_received + %(likes)s) * {LIKE_POINTS} "
+        f"+ (views_received + %(views)s) * {VIEW_POINTS} "
+        f"+ (connections + %(connections)s) * {CONNECTION_POINTS} "
+        "WHERE id = %(id)s RETURNING fame_rating",
+        {"likes": likes, "views": views, "connections": connections, "id": user_id},
+    )
+
+
+def record_like(liker_id, liked_id, is_match):
+    """Counters for a new like row; call before committing the INSERT INTO likes."""
+    _bump(liked_id, likes=1, connections=1 if is_match else 0)
+    if is_match:
+        _bump(liker_id, connections=1)
+
+
+def record_unlike(liker_id, liked_id, was_match):
+    """Counters for a removed like row; call before committing the DELETE FROM likes."""
+    _bump(liked_id, likes=-1, connections=-1 if was_match else 0)
+    if was_match:
+        _bump(liker_id, connections=-1)
+
+
+def record_likes_removed(user_a, user_b, a_liked_b, b_liked_a):
+    """Counters after deleting the likes between two users in both directions (blocks)."""
+    match = -1 if a_liked_b and b_liked_a else 0
+    if a_liked_b:
+        _bump(user_b, likes=-1, connections=match)
+    if b_liked_a:
+        _bump(user_a, likes=-1, connections=match)
+
+
+def record_view(viewed_id):
+    """Counters for a new profile_views row; returns the viewed user's fame_rating afterwards."""
+    row = _bump(viewed_id, views=1)
+    return row["fame_rating"] if row else 0
+
+
+_ACTUAL_COUNTS = (
+    "SELECT u.id, "
+    "(SELECT COUNT(*) FROM likes l WHERE l.liked_id = u.id)::int AS likes_received, "
+    "(SELECT COUNT(*) FROM profile_views v WHERE v.viewed_id = u.id)::int AS views_received, "
+    "(SELECT COUNT(*) FROM likes l1 JOIN likes l2 "
+    "ON l1.liked_id = l2.liker_id AND l1.liker_id = l2.liked_id WHERE l1.liker_id = u.id)::int AS connections "
+    "FROM users u"
+)
+_ACTUAL_FAME = (
+    f"a.likes_received * {LIKE_POINTS} + a.views_received * {VIEW_POINTS} "
+    f"+ a.connections * {CONNECTION_POINTS}"
+)
+
+
+def _rewrite_counters(where, params):
+    return execute(
+        "UPDATE users u SET likes_received = a.likes_received, views_received = a.views_received, "
+        f"connections = a.connections, fame_rating = {_ACTUAL_FAME} "
+        f"FROM ({_ACTUAL_COUNTS} WHERE {where}) a WHERE u.id = a.id",
+        params,
+    )
+
+
+def reconcile_fame(fix=False):
+    """
+    Recompute every user's fame counters from likes/profile_views and return the users whose stored
+    counters or fame_rating drifted; with fix=True those users are rewritten.
+    """
+    pin_primary()  # a lagging replica would report drift that is not there
+    drift = query_all(
+        "SELECT a.*, u.likes_received AS stored_likes, u.views_received AS stored_views, "
+        f"u.connections AS stored_connections, u.fame_rating AS stored_fame, {_ACTUAL_FAME} AS fame_rating "
+        f"FROM ({_ACTUAL_COUNTS}) a JOIN users u ON u.id = a.id "
+        "WHERE (u.likes_received, u.views_received, u.connections, u.fame_rating) IS DISTINCT FROM "
+        f"(a.likes_received, a.views_received, a.connections, {_ACTUAL_FAME}) "
+        "ORDER BY a.id"
+    )
+    if fix and drift:
+        _rewrite_counters("u.id = ANY(%s)", ([r["id"] for r in drift],))
+        commit()
+    return drift
+
+
 def update_user_fame(user_id):
-    rating = calculate_fame_rating(user_id)
-    execute("UPDATE users SET fame_rating = %s WHERE id = %s", (rating, user_id))
+    """Recompute one user's counters and fame_rating from scratch."""
+    _rewrite_counters("u.id = %s", (user_id,))
     commit()
-    return rating
+    row = query_one("SELECT fame_rating FROM users WHERE id = %s", (user_id,))
+    return row["fame_rating"] if row else 0
+
+
+def _claim_dirty(recompute_all):
+    """Clear fame_dirty on the users to rewrite and keep their ids in fame_claim for this transaction."""
+    execute("CREATE TEMP TABLE fame_claim (id INTEGER PRIMARY KEY) ON COMMIT DROP")
+    return execute(
+        "WITH claimed AS (UPDATE users SET fame_dirty = false WHERE fame_dirty OR %s RETURNING id) "
+        "INSERT INTO fame_claim SELECT id FROM claimed",
+        (recompute_all,),
+    )
+
+
+def _rewrite_claimed():
+    return execute(
+        "UPDATE users u SET likes_received = COALESCE(l.cnt, 0), "
+        "views_received = COALESCE(v.cnt, 0), connections = COALESCE(c.cnt, 0), "
+        f"fame_rating = COALESCE(l.cnt, 0) * {LIKE_POINTS} + COALESCE(v.cnt, 0) * {VIEW_POINTS} "
+        f"+ COALESCE(c.cnt, 0) * {CONNECTION_POINTS} "
+        "FROM fame_claim d "
+        "LEFT JOIN (SELECT liked_id, COUNT(*)::int AS cnt FROM likes "
+        "WHERE liked_id IN (SELECT id FROM fame_claim) GROUP BY liked_id) l ON l.liked_id = d.id "
+        "LEFT JOIN (SELECT viewed_id, COUNT(*)::int AS cnt FROM profile_views "
+        "WHERE viewed_id IN (SELECT id FROM fame_claim) GROUP BY viewed_id) v ON v.viewed_id = d.id "
+        "LEFT JOIN (SELECT l1.liker_id, COUNT(*)::int AS cnt FROM likes l1 JOIN likes l2 "
+        "ON l1.liked_id = l2.liker_id AND l1.liker_id = l2.liked_id "
+        "WHERE l1.liker_id IN (SELECT id FROM fame_claim) GROUP BY l1.liker_id) c ON c.liker_id = d.id "
+        "WHERE u.id = d.id"
+    )
+
+
+def recompute_fame(recompute_all=False):
+    """
+    Rewrite counters and fame_rating of every dirty user (or every user) from likes/profile_views,
+    aggregated for those users only. Returns the number of users updated, or None when another
+    process holds the batch lock.
+    """
+    # execute_returning opens the write transaction, so the lock is held until the commit below.
+    if not execute_returning("SELECT pg_try_advisory_xact_lock(%s) AS ok", (_BATCH_LOCK_KEY,))["ok"]:
+        commit()
+        return None
+    # The claim row-locks the users it clears, so a like or view racing with this run blocks on its
+    # own fame_dirty = true until the commit below and leaves the user dirty for the next run.
+    _claim_dirty(recompute_all)
+    updated = _rewrite_claimed()
+    commit()
+    return updated
+
+
+def start_fame_scheduler(app, interval):
+    """Daemon thread running recompute_fame() every `interval` seconds inside `app`'s context."""
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    started = time.perf_counter()
+                    updated = recompute_fame()
+                    app.logger.info(
+                        f"[FAME] batch updated={updated} ms={(time.perf_counter() - started) * 1000:.1f}"
+                    )
+                except Exception as e:
+                    app.logger.error(f"[FAME] batch failed: {e}")
+
+    thread = threading.Thread(target=run, name="fame-batch", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,88 @@
+"""Fixed latitude/longitude grid used to fetch located users ring by ring around a point.
+
+users.geo_cell stores cell_key(latitude, longitude); it is written together with the coordinates
+(profile.update_location, seed data) and filled for older rows by `flask backfill-geo-cells`.
+"""
+
+import math
+from app.database import execute, commit
+
+GRID_DEG = 0.25
+ROWS = int(180 / GRID_DEG)
+COLS = int(360 / GRID_DEG)
+
+# Rings fetched per query while expanding outward: 0, 1, 2-3, 4-7, 8-15, 16-31 (~860 km N/S).
+RING_BANDS = ((0, 0), (1, 1), (2, 3), (4, 7), (8, 15), (16, 31))
+
+
+def _row_col(lat, lng):
+    row = min(int(math.floor((lat + 90) / GRID_DEG)), ROWS - 1)
+    col = int(math.floor((lng + 180) / GRID_DEG)) % COLS
+    return row, col
+
+
+def cell_key(lat, lng):
+    if lat is None or lng is None:
+        return None
+    row, col = _row_col(lat, lng)
+    return row * COLS + col
+
+
+def ring_cells(lat, lng, ring):
+    """Cell keys at Chebyshev distance `ring` from the cell of (lat, lng); columns wrap at ±180."""
+    row, col = _row_col(lat, lng)
+    if ring == 0:
+        return [row * COLS + col]
+    cells = set()
+    for dr in range(-ring, ring + 1):
+        r = row + dr
+        if r < 0 or r >= ROWS:
+            continue
+        if abs(dr) == ring:
+            dcs = range(-ring, ring + 1)
+        else:
+            dcs = (-ring, ring)
+        for dc in dcs:
+            cells.add(r * COLS + (col + dc) % COLS)
+    return sorted(cells)
+
+
+def collect_by_rings(fetch_cells, fetch_rest, lat, lng, wanted):
+    """
+    Call fetch_cells(cells, remaining) band by band outward from (lat, lng) until `wanted` rows are
+    collected; if still short, fetch_rest(scanned_cells, remaining) covers every other row
+    (including rows whose geo_cell has not been backfilled yet).
+    """
+    rows = []
+    scanned = []
+    for first, last in RING_BANDS:
+        cells = []
+        for ring in range(first, last + 1):
+            cells.extend(ring_cells(lat, lng, ring))
+        rows.extend(fetch_cells(cells, wanted - len(rows)))
+        scanned.extend(cells)
+        if len(rows) >= wanted:
+            return rows
+    rows.extend(fetch_rest(scanned, wanted - len(rows)))
+    return rows
+
+
+def geo_cell_sql(lat_col="latitude", lng_col="longitude"):
+    """cell_key() as a SQL expression, for set-based backfills."""
+    return (
+        f"LEAST(floor(({lat_col} + 90) / {GRID_DEG})::int, {ROWS - 1}) * {COLS} + "
+        f"mod(floor(({lng_col} + 180) / {GRID_DEG})::int, {COLS})"
+    )
+
+
+def backfill_geo_cells(recompute_all=False):
+    sql = (
+        f"UPDATE users SET geo_cell = {geo_cell_sql()} "
+        "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+    )
+    if not recompute_all:
+        sql += " AND geo_cell IS NULL"
+    updated = execute(sql)
+    execute("UPDATE users SET geo_cell = NULL WHERE geo_cell IS NOT NULL AND (latitude IS NULL OR longitude IS NULL)")
+    commit()
+    return updated
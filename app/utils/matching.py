@@ -1,8 +1,25 @@
+import base64
+import hashlib
+import heapq
+import json
 import math
+from array import array
 from datetime import date
-from types import SimpleNamespace
-from app.database import query_all
-from app.utils.tags import canonical_tag_name, split_tags_input
+from collections import namedtuple
+from flask import current_app
+from app.database import get_db, query_all, query_tuples, query_iter, prepared
+from app.utils.blocks import not_blocked_sql
+from app.utils.colike import COLIKE_POINTS_SQL, colike_weight, colike_points
+from app.utils.scoring_pool import get_scoring_pool, record_parallel_run
+from app.utils.tag_index import get_tag_index
+from app.utils.tags import (
+    canonical_tag_name, split_tags_input, tag_mask, mask_to_bits, bits_to_mask, common_tag_count,
+)
+
+try:
+    import numpy as np
+except ImportError:  # optional: MATCHING_ENGINE=numpy falls back to the Python scorer
+    np = None
 
 
 def calculate_age(birth_date):
@@ -25,48 +42,137 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     return R * c
 
 
+def bounding_box(lat, lng, radius_km):
+    """
+    Latitude range and longitude ranges enclosing every point within radius_km of (lat, lng).
+    Longitude comes back as 1 range, 2 when the box crosses the antimeridian, or none when a pole
+    is inside the circle. Callers still apply haversine_distance() as the exact check.
+    """
+    R = 6371
+    pad = 1e-6
+    dlat = math.degrees(radius_km / R) + pad
+    lat_min, lat_max = lat - dlat, lat + dlat
+    if lat_min <= -90 or lat_max >= 90:
+        return (max(lat_min, -90.0), min(lat_max, 90.0)), []
+    dlng = math.degrees(math.asin(math.sin(radius_km / R) / math.cos(math.radians(lat)))) + pad
+    lng_min, lng_max = lng - dlng, lng + dlng
+    if lng_min < -180:
+        return (lat_min, lat_max), [(lng_min + 360, 180.0), (-180.0, lng_max)]
+    if lng_max > 180:
+        return (lat_min, lat_max), [(lng_min, 180.0), (-180.0, lng_max - 360)]
+    return (lat_min, lat_max), [(lng_min, lng_max)]
+
+
 def get_user_tag_ids(user_id):
     rows = query_all("SELECT tag_id FROM user_tags WHERE user_id = %s", (user_id,))
     return set(r["tag_id"] for r in rows)
 
 
-def _build_user(row):
-    pp = None
-    if row.get("pp_filename"):
-        pp = SimpleNamespace(id=row.get("pp_id"), filename=row["pp_filename"])
-    data = {k: v for k, v in row.items() if k not in ("pp_filename", "pp_id")}
-    user = SimpleNamespace(**data)
-    user.profile_picture = pp
-    return user
+def get_tag_ids_for_users(user_ids):
+    """One query for a whole candidate list: {user_id: set(tag_id)}, empty set when untagged."""
+    tag_ids = {uid: set() for uid in user_ids}
+    if not tag_ids:
+        return tag_ids
+    rows = query_all(
+        "SELECT user_id, tag_id FROM user_tags WHERE user_id = ANY(%s)",
+        (list(tag_ids),),
+    )
+    for r in rows:
+        tag_ids[r["user_id"]].add(r["tag_id"])
+    return tag_ids
 
 
-def get_matching_candidates(current_user, filters=None):
-    filters = filters or {}
+Picture = namedtuple("Picture", "id filename")
+
+
+class Candidate:
+    """
+    A candidate user: the columns browse cards render plus the ranking inputs, nothing else.
+    Built from CANDIDATE_COLUMNS tuples; profile_picture is a Picture or None.
+    """
+
+    __slots__ = (
+        "id", "username", "first_name", "fame_rating", "latitude", "longitude", "birth_date",
+        "tag_mask", "profile_picture",
+    )
+
+    def __init__(self, id, username, first_name, fame_rating, latitude, longitude, birth_date,
+                 tag_mask, pp_id, pp_filename):
+        self.id = id
+        self.username = username
+        self.first_name = first_name
+        self.fame_rating = fame_rating
+        self.latitude = latitude
+        self.longitude = longitude
+        self.birth_date = birth_date
+        self.tag_mask = tag_mask
+        self.profile_picture = Picture(pp_id, pp_filename) if pp_filename else None
+
+
+# Candidate() arguments in order; the SQL engine reads them back by these names from its CTEs.
+CANDIDATE_COLUMNS = (
+    "u.id, u.username, u.first_name, u.fame_rating, u.latitude, u.longitude, u.birth_date, "
+    "u.tag_mask, ui.id AS pp_id, ui.filename AS pp_filename"
+)
+_CANDIDATE_NAMES = (
+    "id, username, first_name, fame_rating, latitude, longitude, birth_date, tag_mask, pp_id, pp_filename"
+)
+_CANDIDATE_WIDTH = 10
+
+
+# Above this many matching users the tag filter uses the user_tags semi-join instead of the index:
+# psycopg2 inlines the id list as an ARRAY[...] literal in the SQL text of every query.
+TAG_INDEX_MAX_IDS = 5000
+
+# users.orientation_bucket (generated column): index in BUCKET_GENDERS * 4 + index in BUCKET_PREFERENCES.
+BUCKET_GENDERS = ("male", "female", "other", None)
+BUCKET_PREFERENCES = ("heterosexual", "homosexual", "bisexual", None)
+
+
+def orientation_bucket(gender, preference):
+    return BUCKET_GENDERS.index(gender or None) * 4 + BUCKET_PREFERENCES.index(preference or None)
+
+
+def orientation_compatible(viewer_gender, viewer_preference, gender, preference):
+    """Whether a viewer may be shown a candidate; comparisons against a NULL gender never match."""
+    if viewer_gender and viewer_preference == "heterosexual":
+        opposite = {"male": "female", "female": "male"}.get(viewer_gender)
+        if opposite and gender != opposite:
+            return False
+    elif viewer_gender and viewer_preference == "homosexual" and gender != viewer_gender:
+        return False
+    if not viewer_gender:
+        return True
+    return (
+        preference in (None, "bisexual")
+        or (preference == "heterosexual" and gender is not None and gender != viewer_gender)
+        or (preference == "homosexual" and gender == viewer_gender)
+    )
+
+
+def target_buckets(viewer_gender, viewer_preference):
+    """orientation_bucket values of every candidate compatible with the viewer."""
+    return [
+        orientation_bucket(g, p)
+        for g in BUCKET_GENDERS
+        for p in BUCKET_PREFERENCES
+        if orientation_compatible(viewer_gender, viewer_preference, g, p)
+    ]
+
+
+def _candidate_conditions(current_user, filters):
+    """WHERE clauses (and their params) shared by every ranking engine."""
     params = [current_user.id, current_user.id, current_user.id]
     where = [
         "u.id != %s",
         "u.email_verified = true",
-        "u.id NOT IN (SELECT blocked_id FROM blocks WHERE blocker_id = %s)",
-        "u.id NOT IN (SELECT blocker_id FROM blocks WHERE blocked_id = %s)",
+        not_blocked_sql(),
     ]
 
-    if current_user.gender and current_user.sexual_preference:
-        if current_user.sexual_preference == "heterosexual":
-            if current_user.gender == "male":
-                where.append("u.gender = 'female'")
-            elif current_user.gender == "female":
-                where.append("u.gender = 'male'")
-        elif current_user.sexual_preference == "homosexual":
-            where.append("u.gender = %s")
-            params.append(current_user.gender)
-
-    if current_user.gender:
-        where.append(
-            "(u.sexual_preference IS NULL OR u.sexual_preference = 'bisexual' OR "
-            "(u.sexual_preference = 'heterosexual' AND u.gender != %s) OR "
-            "(u.sexual_preference = 'homosexual' AND u.gender = %s))"
-        )
-        params.extend([current_user.gender, current_user.gender])
+    buckets = target_buckets(current_user.gender, current_user.sexual_preference)
+    if len(buckets) < len(BUCKET_GENDERS) * len(BUCKET_PREFERENCES):
+        where.append("u.orientation_bucket = ANY(%s)")
+        params.append(buckets)
 
     if filters.get("age_min"):
         max_birth = date.today().replace(year=date.today().year - int(filters["age_min"]))
@@ -90,7 +196,13 @@ def get_matching_candidates(current_user, filters=None):
             if c and c not in seen_names:
                 seen_names.add(c)
                 tag_names.append(c)
-        if tag_names:
+        tagged = None
+        if tag_names and current_app.config.get("TAG_INDEX_ENABLED", True):
+            tagged = get_tag_index().union(tag_names)
+        if tagged is not None and len(tagged) <= TAG_INDEX_MAX_IDS:
+            where.append("u.id = ANY(%s)")
+            params.append(tagged)
+        elif tag_names:
             ph = ",".join(["%s"] * len(tag_names))
             where.append(
                 f"u.id IN (SELECT ut.user_id FROM user_tags ut "
@@ -102,30 +214,69 @@ def get_matching_candidates(current_user, filters=None):
     where.append("u.latitude IS NOT NULL AND u.longitude IS NOT NULL")
     where.append("(u.location_enabled = true OR btrim(COALESCE(u.location_place, '')) <> '')")
 
+    # Prefilter for location_max on ix_users_lat_lng; the ranking engines keep the exact distance check.
+    if filters.get("location_max") and current_user.latitude and current_user.longitude:
+        (lat_min, lat_max), lng_ranges = bounding_box(
+            current_user.latitude, current_user.longitude, float(filters["location_max"])
+        )
+        where.append("u.latitude BETWEEN %s AND %s")
+        params.extend([lat_min, lat_max])
+        if lng_ranges:
+            where.append(
+                "(" + " OR ".join(["u.longitude BETWEEN %s AND %s"] * len(lng_ranges)) + ")"
+            )
+            for lo, hi in lng_ranges:
+                params.extend([lo, hi])
+    return where, params
+
+
+def _candidates_sql(current_user, filters):
+    where, params = _candidate_conditions(current_user, filters)
     sql = (
-        "SELECT u.*, ui.filename AS pp_filename, ui.id AS pp_id "
+        f"SELECT {CANDIDATE_COLUMNS} "
         "FROM users u LEFT JOIN user_images ui ON u.profile_picture_id = ui.id "
         "WHERE " + " AND ".join(where)
     )
-    return query_all(sql, params)
+    return sql, params
+
+
+def get_matching_candidates(current_user, filters=None):
+    """Every compatible candidate as a Candidate."""
+    sql, params = _candidates_sql(current_user, filters or {})
+    return [Candidate(*r) for r in query_tuples(prepared(sql), params)]
 
 
-def score_user(user, current_user, my_tag_ids):
+def iter_matching_candidates(current_user, filters=None):
+    """
+    get_matching_candidates() streamed from a server-side cursor (see database.query_iter), which
+    runs the scan unprepared even with PREPARED_STATEMENTS on.
+    """
+    sql, params = _candidates_sql(current_user, filters or {})
+    return (Candidate(*r) for r in query_iter(sql, params))
+
+
+def _proximity_points(dist):
+    if dist is None:
+        return 0
+    if dist < 10:
+        return 1000
+    if dist < 50:
+        return 500
+    if dist < 100:
+        return 200
+    return max(0, 100 - int(dist / 10))
+
+
+def score_user(user, current_user, my_tag_ids, user_tag_ids=None, common_tags=None):
     score = 0
     if current_user.latitude and current_user.longitude and user.latitude and user.longitude:
         dist = haversine_distance(current_user.latitude, current_user.longitude, user.latitude, user.longitude)
-        if dist is not None:
-            if dist < 10:
-                score += 1000
-            elif dist < 50:
-                score += 500
-            elif dist < 100:
-                score += 200
-            else:
-                score += max(0, 100 - int(dist / 10))
-    user_tag_ids = get_user_tag_ids(user.id)
-    common = len(my_tag_ids & user_tag_ids)
-    score += common * 50
+        score += _proximity_points(dist)
+    if common_tags is None:
+        if user_tag_ids is None:
+            user_tag_ids = get_user_tag_ids(user.id)
+        common_tags = len(my_tag_ids & user_tag_ids)
+    score += common_tags * 50
     score += user.fame_rating
     return score
 
@@ -140,42 +291,475 @@ def _user_ready_for_proximity_matching(user):
     return bool(str(place).strip())
 
 
-def get_suggestions(current_user, sort_by=None, filters=None, limit=50):
-    if not _user_ready_for_proximity_matching(current_user):
-        return []
+def sort_key(item, sort_by):
+    """Ordering shared by all engines; user id breaks ties so pages are deterministic."""
+    return _sort_key(
+        sort_by, item["user"].id, item["user"].fame_rating, item["score"], item["age"],
+        item["distance"], item["common_tags"],
+    )
+
+
+def _sort_key(sort_by, uid, fame, score, age, distance, common_tags):
+    if sort_by == "age":
+        return (age is None, age or 0, uid)
+    if sort_by == "location":
+        return (distance is None, distance or 0, uid)
+    if sort_by == "fame":
+        return (-fame, uid)
+    if sort_by == "tags":
+        return (-common_tags, uid)
+    return (-score, uid)
+
+
+def _viewer_tag_mask(current_user):
+    bits = getattr(current_user, "tag_mask", None)
+    if bits is not None:
+        return bits_to_mask(bits)
+    return tag_mask(get_user_tag_ids(current_user.id))
+
+
+def _common_tag_counts(rows, my_mask):
+    """Common tags per Candidate from users.tag_mask; candidates without a mask yet fall back to user_tags."""
+    counts = [0] * len(rows)
+    if not my_mask:
+        return counts
+    missing = []
+    for i, r in enumerate(rows):
+        if r.tag_mask is None:
+            missing.append(i)
+        else:
+            counts[i] = common_tag_count(bits_to_mask(r.tag_mask), my_mask)
+    if missing:
+        tags_by_user = get_tag_ids_for_users([rows[i].id for i in missing])
+        for i in missing:
+            counts[i] = common_tag_count(tag_mask(tags_by_user[rows[i].id]), my_mask)
+    return counts
+
+
+def _rank_python(current_user, sort_by, filters, after=None, k=None):
+    """
+    The first k suggestions ranked after `after` (all of them when k is None) and the total.
+    Candidates are streamed through _rank_rows; with a running scoring pool they are loaded
+    instead, and from SCORING_PARALLEL_THRESHOLD on the pool does the work.
+    """
+    pool = get_scoring_pool()
+    if pool is None:
+        rows = iter_matching_candidates(current_user, filters)
+        return _rank_rows(current_user, rows, sort_by, filters, after, k)
     rows = get_matching_candidates(current_user, filters)
-    users = [_build_user(r) for r in rows]
-    my_tag_ids = get_user_tag_ids(current_user.id)
+    if len(rows) >= current_app.config.get("SCORING_PARALLEL_THRESHOLD", 40000):
+        return _rank_parallel(pool, current_user, rows, sort_by, filters, after, k)
+    return _rank_rows(current_user, rows, sort_by, filters, after, k)
+
+
+def _rank_rows(current_user, rows, sort_by, filters, after=None, k=None):
+    """
+    _rank_python in this process, in one pass over any iterable of Candidates. location_max is
+    applied before scoring, sort keys are computed once per candidate and with k only the k best
+    so far are kept (heapq.nsmallest), so memory does not grow with the number of candidates.
+    """
+    max_dist = float(filters["location_max"]) if filters.get("location_max") else None
+    lat, lng = current_user.latitude, current_user.longitude
+    my_mask = _viewer_tag_mask(current_user)
+    weight = colike_weight()
+    colike = None
+    total = 0
+    unmasked = []
+
+    def keyed(row, dist, common_tags):
+        nonlocal colike
+        score = _proximity_points(dist) + common_tags * 50 + row.fame_rating
+        if weight:
+            if colike is None:
+                colike = colike_points(current_user.id)
+            score += weight * colike.get(row.id, 0)
+        age = calculate_age(row.birth_date) if sort_by == "age" else None
+        key = _sort_key(sort_by, row.id, row.fame_rating, score, age, dist, common_tags)
+        if after is None or key > after:
+            # The key ends with the user id, so rows themselves are never compared.
+            yield key, score, row, dist, common_tags
+
+    def ranked():
+        nonlocal total
+        for row in rows:
+            dist = None
+            if lat and lng and row.latitude and row.longitude:
+                dist = haversine_distance(lat, lng, row.latitude, row.longitude)
+            if max_dist is not None and (dist is None or dist > max_dist):
+                continue
+            total += 1
+            if not my_mask:
+                yield from keyed(row, dist, 0)
+            elif row.tag_mask is None:
+                unmasked.append((row, dist))
+            else:
+                yield from keyed(row, dist, common_tag_count(bits_to_mask(row.tag_mask), my_mask))
+
+    best = sorted(ranked()) if k is None else heapq.nsmallest(k, ranked())
+    if unmasked:
+        # Candidates without a tag mask yet: common tags from user_tags, in one query at the end.
+        counts = _common_tag_counts([row for row, _ in unmasked], my_mask)
+        late = [entry for (row, dist), c in zip(unmasked, counts) for entry in keyed(row, dist, c)]
+        best = sorted(best + late) if k is None else heapq.nsmallest(k, best + late)
     scored = []
-    for u in users:
+    for _, score, row, dist, common_tags in best:
+        scored.append({
+            "user": row,
+            "score": score,
+            "distance": dist,
+            "age": calculate_age(row.birth_date),
+            "common_tags": common_tags,
+        })
+    return scored, total
+
+
+def _score_chunk(task):
+    """
+    Worker side of _rank_parallel: the rows of one chunk kept by location_max, and the k smallest
+    (sort key, row index, score, distance) among those ranked after `after`.
+    """
+    (start, sort_by, lat, lng, max_dist, after, k,
+     ids, lats, lngs, fame, births, common, colike) = task
+    kept = 0
+    keyed = []
+    for j, uid in enumerate(ids):
         dist = None
-        if current_user.latitude and current_user.longitude and u.latitude and u.longitude:
-            dist = haversine_distance(current_user.latitude, current_user.longitude, u.latitude, u.longitude)
-        age = calculate_age(u.birth_date)
-        common_tags = len(my_tag_ids & get_user_tag_ids(u.id))
-        score = score_user(u, current_user, my_tag_ids)
+        if lat and lng and lats[j] and lngs[j]:
+            dist = haversine_distance(lat, lng, lats[j], lngs[j])
+        if max_dist is not None and (dist is None or dist > max_dist):
+            continue
+        kept += 1
+        score = _proximity_points(dist) + common[j] * 50 + fame[j]
+        if colike is not None:
+            score += colike[j]
+        age = calculate_age(date.fromordinal(births[j])) if sort_by == "age" and births[j] else None
+        key = _sort_key(sort_by, uid, fame[j], score, age, dist, common[j])
+        if after is None or key > after:
+            keyed.append((key, start + j, score, dist))
+    if k is not None:
+        keyed = heapq.nsmallest(k, keyed)
+    return kept, keyed
+
+
+def _rank_parallel(pool, current_user, rows, sort_by, filters, after=None, k=None):
+    """
+    Same result as _rank_rows, scored by the worker processes of `pool`. Candidates go over as
+    one array("l"/"d") slice per column and worker, each worker returns only its own top k.
+    """
+    n = len(rows)
+    workers = max(1, current_app.config.get("SCORING_WORKERS", 1))
+    common = _common_tag_counts(rows, _viewer_tag_mask(current_user))
+    weight = colike_weight()
+    points = colike_points(current_user.id) if weight else {}
+    columns = (
+        array("l", (r.id for r in rows)),
+        array("d", (r.latitude or 0.0 for r in rows)),
+        array("d", (r.longitude or 0.0 for r in rows)),
+        array("l", (r.fame_rating for r in rows)),
+        array("l", (r.birth_date.toordinal() if r.birth_date else 0 for r in rows)),
+        array("l", common),
+        array("l", (weight * points.get(r.id, 0) for r in rows)) if points else None,
+    )
+    max_dist = float(filters["location_max"]) if filters.get("location_max") else None
+    head = (sort_by, current_user.latitude, current_user.longitude, max_dist, after, k)
+    size = -(-n // workers)
+    tasks = [
+        (start, *head, *(None if c is None else c[start:start + size] for c in columns))
+        for start in range(0, n, size)
+    ]
+    total = 0
+    keyed = []
+    for kept, chunk in pool.map(_score_chunk, tasks):
+        total += kept
+        keyed.extend(chunk)
+    keyed = sorted(keyed) if k is None else heapq.nsmallest(k, keyed)
+    record_parallel_run(n)
+    scored = []
+    for _, i, score, dist in keyed:
+        row = rows[i]
         scored.append({
-            "user": u,
+            "user": row,
             "score": score,
             "distance": dist,
+            "age": calculate_age(row.birth_date),
+            "common_tags": common[i],
+        })
+    return scored, total
+
+
+# sort_key() as SQL expressions per sort mode (id is appended), used for ORDER BY and the keyset.
+_SQL_SORT_KEYS = {
+    "age": ("age IS NULL", "COALESCE(age, 0)"),
+    "location": ("distance IS NULL", "COALESCE(distance, 0)"),
+    "fame": ("-fame_rating",),
+    "tags": ("-common_tags",),
+}
+_SQL_RANK_COLUMNS = ("distance", "age", "common_tags", "score", "total_count")
+
+
+def _has_bit_count():
+    """bit_count() on bit strings arrived in PostgreSQL 14; older servers count through user_tags."""
+    return get_db().server_version >= 140000
+
+
+def _rank_sql(current_user, sort_by, filters, limit, offset, after=None):
+    """Same ranking as _rank_python, evaluated in PostgreSQL so only one page is fetched."""
+    where, where_params = _candidate_conditions(current_user, filters)
+    today = date.today()
+    # Placeholders in statement order: common_tags, age, co-likes, haversine, WHERE, location_max,
+    # keyset.
+    my_bits = mask_to_bits(_viewer_tag_mask(current_user))
+    if my_bits:
+        shared_sql = "(SELECT COUNT(*) FROM user_tags ut WHERE ut.user_id = u.id AND ut.tag_id = ANY(%s))"
+        params = [[i + 1 for i, c in enumerate(my_bits) if c == "1"]]
+        if _has_bit_count():
+            # Both masks cut to the viewer's width, so higher tag ids the viewer lacks drop out.
+            common_sql = (
+                f"COALESCE(bit_count(CAST(u.tag_mask AS bit({len(my_bits)})) & CAST(%s AS bit({len(my_bits)}))), "
+                f"{shared_sql})::int"
+            )
+            params.insert(0, my_bits)
+        else:
+            common_sql = f"{shared_sql}::int"
+    else:
+        common_sql = "0"
+        params = []
+    params.extend([today.year, today.month, today.day])
+    # calculate_age(), spelled out so birthdays on the boundary agree with Python.
+    age_sql = (
+        "%s - EXTRACT(YEAR FROM u.birth_date)::int - CASE WHEN "
+        "(EXTRACT(MONTH FROM u.birth_date), EXTRACT(DAY FROM u.birth_date)) > (%s, %s) "
+        "THEN 1 ELSE 0 END"
+    )
+    weight = colike_weight()
+    if weight:
+        colike_sql = "COALESCE(cl.points, 0)"
+        colike_join = f"LEFT JOIN ({COLIKE_POINTS_SQL}) cl ON cl.similar_id = u.id "
+        params.append(current_user.id)
+    else:
+        colike_sql = "0"
+        colike_join = ""
+    if current_user.latitude and current_user.longitude:
+        # haversine_distance(); a zero coordinate counts as "no location" like the Python scorer.
+        distance_sql = (
+            "CASE WHEN u.latitude <> 0 AND u.longitude <> 0 "
+            "THEN 6371 * 2 * atan2(sqrt(h.a), sqrt(1 - h.a)) END"
+        )
+        hav_sql = (
+            "CROSS JOIN LATERAL (SELECT "
+            "power(sin(radians(u.latitude - %s) / 2), 2) + "
+            "cos(radians(%s)) * cos(radians(u.latitude)) * "
+            "power(sin(radians(u.longitude - %s) / 2), 2) AS a) h "
+        )
+        params.extend([current_user.latitude, current_user.latitude, current_user.longitude])
+    else:
+        distance_sql = "NULL::double precision"
+        hav_sql = ""
+    params.extend(where_params)
+    outer_where = ""
+    if filters.get("location_max"):
+        outer_where = "WHERE distance <= %s "
+        params.append(float(filters["location_max"]))
+    keys = ", ".join(_SQL_SORT_KEYS.get(sort_by, ("-score",)) + ("id",))
+    keyset = ""
+    if after is not None:
+        keyset = f"WHERE ({keys}) > ({', '.join(['%s'] * len(after))}) "
+        params.extend(after)
+    sql = (
+        "WITH cand AS ("
+        f"SELECT {CANDIDATE_COLUMNS}, "
+        f"{distance_sql} AS distance, "
+        f"{common_sql} AS common_tags, "
+        f"{age_sql} AS age, "
+        f"{colike_sql} AS colike "
+        "FROM users u LEFT JOIN user_images ui ON u.profile_picture_id = ui.id "
+        f"{colike_join}"
+        f"{hav_sql}"
+        "WHERE " + " AND ".join(where) + "), "
+        "scored AS (SELECT cand.*, "
+        "CASE WHEN distance IS NULL THEN 0 "
+        "WHEN distance < 10 THEN 1000 "
+        "WHEN distance < 50 THEN 500 "
+        "WHEN distance < 100 THEN 200 "
+        "ELSE GREATEST(0, 100 - trunc(distance / 10)::int) END "
+        f"+ common_tags * 50 + fame_rating + {weight} * colike AS score "
+        "FROM cand), "
+        "counted AS (SELECT scored.*, COUNT(*) OVER () AS total_count FROM scored "
+        f"{outer_where}) "
+        f"SELECT {_CANDIDATE_NAMES}, {', '.join(_SQL_RANK_COLUMNS)} FROM counted {keyset}"
+        f"ORDER BY {keys}"
+    )
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    if offset:
+        sql += " OFFSET %s"
+        params.append(offset)
+    rows = query_tuples(sql, params)
+    total = rows[0][-1] if rows else 0
+    results = []
+    for r in rows:
+        distance, age, common_tags, score, _ = r[_CANDIDATE_WIDTH:]
+        results.append({
+            "user": Candidate(*r[:_CANDIDATE_WIDTH]),
+            "score": score,
+            "distance": distance,
             "age": age,
             "common_tags": common_tags,
         })
+    return results, total
+
+
+def _rank_numpy(current_user, sort_by, filters, limit, offset, after=None):
+    """Same ranking as _rank_python, computed on arrays with a partial sort for the requested page."""
+    rows = get_matching_candidates(current_user, filters)
+    if not rows:
+        return [], 0
+    n = len(rows)
+    ids = np.fromiter((r.id for r in rows), dtype=np.int64, count=n)
+    lat = np.fromiter((r.latitude for r in rows), dtype=np.float64, count=n)
+    lng = np.fromiter((r.longitude for r in rows), dtype=np.float64, count=n)
+    fame = np.fromiter((r.fame_rating for r in rows), dtype=np.int64, count=n)
+
+    # Distance: haversine_distance() vectorized; zero coordinates mean "no location" as in score_user.
+    has_dist = (lat != 0) & (lng != 0)
+    if not (current_user.latitude and current_user.longitude):
+        has_dist[:] = False
+    distance = np.full(n, np.inf)
+    if has_dist.any():
+        phi1 = math.radians(current_user.latitude)
+        phi2 = np.radians(lat[has_dist])
+        dphi = np.radians(lat[has_dist] - current_user.latitude)
+        dlambda = np.radians(lng[has_dist] - current_user.longitude)
+        a = np.sin(dphi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+        distance[has_dist] = 6371 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    # Age: calculate_age() on year/month/day arrays.
+    today = date.today()
+    births = [r.birth_date for r in rows]
+    has_age = np.fromiter((b is not None for b in births), dtype=bool, count=n)
+    b_year = np.fromiter((b.year if b else 0 for b in births), dtype=np.int64, count=n)
+    b_month = np.fromiter((b.month if b else 0 for b in births), dtype=np.int64, count=n)
+    b_day = np.fromiter((b.day if b else 0 for b in births), dtype=np.int64, count=n)
+    before_birthday = (b_month > today.month) | ((b_month == today.month) & (b_day > today.day))
+    age = today.year - b_year - before_birthday
+
+    common = np.array(_common_tag_counts(rows, _viewer_tag_mask(current_user)), dtype=np.int64)
+
+    finite = np.where(has_dist, distance, 0.0)
+    bucket = np.select(
+        [~has_dist, finite < 10, finite < 50, finite < 100],
+        [0, 1000, 500, 200],
+        default=np.maximum(0, 100 - np.trunc(finite / 10)).astype(np.int64),
+    )
+    score = bucket + common * 50 + fame
+    weight = colike_weight()
+    if weight:
+        points = colike_points(current_user.id)
+        score += weight * np.fromiter((points.get(r.id, 0) for r in rows), dtype=np.int64, count=n)
+
+    keep = np.ones(n, dtype=bool)
+    if filters.get("location_max"):
+        keep = has_dist & (distance <= float(filters["location_max"]))
+    idx = np.flatnonzero(keep)
+    total = len(idx)
+
     if sort_by == "age":
-        scored.sort(key=lambda x: (x["age"] is None, x["age"] or 0))
+        primary = np.where(has_age, age, np.inf)
     elif sort_by == "location":
-        scored.sort(key=lambda x: (x["distance"] is None, x["distance"] or 9999))
+        primary = distance
     elif sort_by == "fame":
-        scored.sort(key=lambda x: -x["user"].fame_rating)
+        primary = -fame
     elif sort_by == "tags":
-        scored.sort(key=lambda x: -x["common_tags"])
+        primary = -common
     else:
-        scored.sort(key=lambda x: -x["score"])
-    if filters and filters.get("location_max"):
-        max_dist = float(filters["location_max"])
-        scored = [s for s in scored if s["distance"] is not None and s["distance"] <= max_dist]
-    return scored[:limit]
+        primary = -score
+    primary = primary[idx].astype(np.float64)
+    if after is not None:
+        # Keyset: rows whose (primary, id) sorts after the cursor's sort_key().
+        if sort_by in ("age", "location"):
+            after_primary = np.inf if after[0] else after[1]
+        else:
+            after_primary = after[0]
+        later = (primary > after_primary) | ((primary == after_primary) & (ids[idx] > after[-1]))
+        idx, primary = idx[later], primary[later]
+    k = len(idx)
+    if limit is not None:
+        k = min(k, offset + limit)
+    if 0 < k < len(idx):
+        # Only rows tied with or ahead of the k-th key can land on the page.
+        kth = primary[np.argpartition(primary, k - 1)[k - 1]]
+        head = np.flatnonzero(primary <= kth)
+        idx, primary = idx[head], primary[head]
+    order = idx[np.lexsort((ids[idx], primary))][offset:k]
+
+    results = []
+    for i in order.tolist():
+        results.append({
+            "user": rows[i],
+            "score": int(score[i]),
+            "distance": float(distance[i]) if has_dist[i] else None,
+            "age": int(age[i]) if has_age[i] else None,
+            "common_tags": int(common[i]),
+        })
+    return results, total
+
+
+def rank_suggestions(current_user, sort_by=None, filters=None, limit=50, offset=0, after=None, engine=None):
+    """
+    One page of ranked suggestions plus the total number of matches (the sql engine reads it off
+    the page, so an empty page reports 0). `after` is a sort_key() tuple (see encode_cursor);
+    only rows ranked after it are returned.
+    engine is "python" (score in the app), "numpy" (vectorized, needs NumPy, otherwise python)
+    or "sql" (score in PostgreSQL); defaults to MATCHING_ENGINE.
+    """
+    if not _user_ready_for_proximity_matching(current_user):
+        return [], 0
+    filters = filters or {}
+    engine = engine or current_app.config.get("MATCHING_ENGINE", "python")
+    if engine == "sql":
+        return _rank_sql(current_user, sort_by, filters, limit, offset, after)
+    if engine == "numpy" and np is not None:
+        return _rank_numpy(current_user, sort_by, filters, limit, offset, after)
+    end = None if limit is None else offset + limit
+    scored, total = _rank_python(current_user, sort_by, filters, after, k=end)
+    return scored[offset:], total
+
+
+def get_suggestions(current_user, sort_by=None, filters=None, limit=50, offset=0, engine=None):
+    results, _ = rank_suggestions(current_user, sort_by, filters, limit, offset, engine=engine)
+    return results
+
+
+def filters_digest(sort_by, filters):
+    return hashlib.sha1(
+        json.dumps([sort_by, sorted((filters or {}).items())], default=str).encode()
+    ).hexdigest()[:16]
+
+
+def encode_cursor(item, sort_by, filters):
+    """Opaque token for the position after `item`, bound to the sort/filter set it came from."""
+    payload = json.dumps({"k": list(sort_key(item, sort_by)), "f": filters_digest(sort_by, filters)})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, sort_by, filters):
+    """The sort_key() tuple in `token`, or None when it is malformed or from another search."""
+    if not token:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        key = tuple(payload["k"])
+        digest = payload["f"]
+    except (ValueError, TypeError, KeyError):
+        return None
+    if digest != filters_digest(sort_by, filters):
+        return None
+    expected = 3 if sort_by in ("age", "location") else 2
+    if len(key) != expected or not all(isinstance(v, (int, float)) for v in key):
+        return None
+    return key
 
 
-def search_users(current_user, filters, sort_by=None, limit=50):
-    return get_suggestions(current_user, sort_by=sort_by, filters=filters, limit=limit)
+def search_users(current_user, filters, sort_by=None, limit=50, offset=0):
+    return get_suggestions(current_user, sort_by=sort_by, filters=filters, limit=limit, offset=offset)
@@ -0,0 +1,51 @@
+"""Worker processes for scoring very large candidate sets with the python engine.
+
+With SCORING_WORKERS > 0 create_app() starts the pool and waits until every worker is up and has
+imported the scorer; rank_suggestions() only hands work to it from SCORING_PARALLEL_THRESHOLD
+candidates on (see app.utils.matching._rank_parallel).
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+
+_lock = threading.Lock()
+_stats = {"parallel_runs": 0, "candidates": 0}
+
+
+def _warm(_):
+    import app.utils.matching  # noqa: F401
+    return os.getpid()
+
+
+def start_scoring_pool(app, workers):
+    # spawn, not fork: the parent holds database connections and eventlet/socketio threads.
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    # Each submit starts a worker while none is idle, so this brings all of them up now.
+    pids = set(pool.map(_warm, range(workers)))
+    app.extensions["scoring_pool"] = pool
+    atexit.register(pool.shutdown, wait=False, cancel_futures=True)
+    app.logger.info(f"[SCORING] {len(pids)} workers ready")
+    return pool
+
+
+def get_scoring_pool():
+    return current_app.extensions.get("scoring_pool")
+
+
+def record_parallel_run(candidates):
+    with _lock:
+        _stats["parallel_runs"] += 1
+        _stats["candidates"] += candidates
+
+
+def get_pool_stats():
+    pool = get_scoring_pool()
+    with _lock:
+        stats = dict(_stats)
+    stats["workers"] = current_app.config.get("SCORING_WORKERS", 0) if pool else 0
+    stats["threshold"] = current_app.config.get("SCORING_PARALLEL_THRESHOLD", 40000)
+    return stats
@@ -0,0 +1,120 @@
+"""Per-viewer cache of ranked suggestions.
+
+Entries are keyed by viewer, a per-viewer version token and the sort/filter set. Events that change
+a viewer's own ranking (likes, unlikes, blocks, profile, tag and location edits) drop the token via
+invalidate_suggestions(); changes to other users' fame or photos age out with SUGGESTIONS_CACHE_TTL.
+"""
+
+import bisect
+import threading
+import time
+import uuid
+from flask import current_app
+from app import cache
+from app.utils.matching import (
+    rank_suggestions, filters_digest, encode_cursor, decode_cursor, sort_key,
+)
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "rebuilds": 0, "rebuild_ms_total": 0.0, "rebuild_ms_max": 0.0}
+
+
+def _version(key):
+    token = cache.get(key)
+    if token is None:
+        token = uuid.uuid4().hex[:12]
+        cache.set(key, token, timeout=0)
+    return token
+
+
+def _cache_key(user_id, sort_by, filters):
+    return "suggestions:{}:{}:{}:{}".format(
+        user_id, _version("suggestions_ver:all"), _version(f"suggestions_ver:{user_id}"),
+        filters_digest(sort_by, filters),
+    )
+
+
+def _record(hit, rebuild_ms=None):
+    with _lock:
+        if hit:
+            _stats["hits"] += 1
+            return
+        _stats["misses"] += 1
+        if rebuild_ms is not None:
+            _stats["rebuilds"] += 1
+            _stats["rebuild_ms_total"] += rebuild_ms
+            _stats["rebuild_ms_max"] = max(_stats["rebuild_ms_max"], rebuild_ms)
+
+
+def _lookup(key, build, ttl, user_id):
+    entry = cache.get(key)
+    if entry is not None:
+        _record(True)
+        return entry
+    started = time.perf_counter()
+    entry = build()
+    rebuild_ms = (time.perf_counter() - started) * 1000
+    cache.set(key, entry, timeout=ttl)
+    _record(False, rebuild_ms)
+    current_app.logger.debug(f"[SUGGESTIONS_CACHE] miss user={user_id} rebuild_ms={rebuild_ms:.1f}")
+    return entry
+
+
+def ranked_page(current_user, sort_by=None, filters=None, limit=20, cursor=None):
+    """
+    One page of rank_suggestions() after `cursor`, through the cache: (results, total, next_cursor).
+    The python/numpy engines cache the first SUGGESTIONS_CACHE_DEPTH ranked rows and pages are
+    slices found by bisecting the sort keys (pages past that prefix are ranked directly); the sql
+    engine caches each keyset page it fetched.
+    """
+    after = decode_cursor(cursor, sort_by, filters)
+    ttl = current_app.config.get("SUGGESTIONS_CACHE_TTL", 120)
+    # One extra row tells whether there is a next page.
+    if not ttl:
+        results, total = rank_suggestions(current_user, sort_by, filters, limit + 1, after=after)
+    elif current_app.config.get("MATCHING_ENGINE", "python") == "sql":
+        key = _cache_key(current_user.id, sort_by, filters) + f":{limit}:{cursor if after else ''}"
+        results, total = _lookup(
+            key,
+            lambda: rank_suggestions(current_user, sort_by, filters, limit + 1, after=after),
+            ttl, current_user.id,
+        )
+    else:
+        depth = current_app.config.get("SUGGESTIONS_CACHE_DEPTH", 500)
+
+        def build():
+            ranking, count = rank_suggestions(current_user, sort_by, filters, limit=depth)
+            return ranking, count, [sort_key(r, sort_by) for r in ranking]
+
+        ranking, total, keys = _lookup(
+            _cache_key(current_user.id, sort_by, filters), build, ttl, current_user.id
+        )
+        start = bisect.bisect_right(keys, after) if after is not None else 0
+        results = ranking[start:start + limit + 1]
+        if len(results) <= limit and len(ranking) < total:
+            results, total = rank_suggestions(current_user, sort_by, filters, limit + 1, after=after)
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = encode_cursor(results[-1], sort_by, filters)
+    return results, total, next_cursor
+
+
+def invalidate_suggestions(*user_ids):
+    cache.delete_many(*[f"suggestions_ver:{uid}" for uid in user_ids])
+
+
+def invalidate_all_suggestions():
+    cache.delete("suggestions_ver:all")
+
+
+def get_cache_stats():
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+    stats["rebuild_ms_avg"] = (
+        round(stats["rebuild_ms_total"] / stats["rebuilds"], 2) if stats["rebuilds"] else None
+    )
+    stats["ttl"] = current_app.config.get("SUGGESTIONS_CACHE_TTL", 120)
+    return stats
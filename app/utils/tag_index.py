@@ -0,0 +1,173 @@
+"""In-process inverted index: tag name -> sorted array of user ids.
+
+Built from user_tags on the first tag search of each app, kept current by set_user_tags() in this
+process and, once older than TAG_INDEX_MAX_AGE seconds, refreshed by a background thread so other
+workers' edits show up; requests keep searching the current copy meanwhile.
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from heapq import merge
+from flask import current_app
+from app.database import query_all, pin_primary
+
+
+class TagIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held for a whole build so only one thread at a time reads user_tags.
+        self._build_lock = threading.Lock()
+        self._postings = {}
+        self._user_tags = {}
+        # set_user() calls made while a build runs, replayed on its result (its SELECT may predate them).
+        self._pending = None
+        self.refreshing = False
+        self.built_at = None
+        self.build_ms = None
+        self.builds = 0
+
+    def rebuild(self):
+        """Reload from user_tags, waiting for a build already running to finish first."""
+        with self._build_lock:
+            self._build()
+
+    def ensure_built(self):
+        with self._build_lock:
+            if self.built_at is None:
+                self._build()
+
+    def refresh_in_background(self, app):
+        """Start one rebuild thread in `app`'s context unless one is already running."""
+        with self._lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+
+        def run():
+            try:
+                with app.app_context():
+                    self.rebuild()
+            except Exception as e:
+                app.logger.error(f"[TAG_INDEX] refresh failed: {e}")
+            finally:
+                self.refreshing = False
+
+        threading.Thread(target=run, name="tag-index-refresh", daemon=True).start()
+
+    def _build(self):
+        started = time.perf_counter()
+        with self._lock:
+            self._pending = {}
+        try:
+            pin_primary()  # set_user_tags() commits on the primary; a replica may not have those rows yet
+            rows = query_all(
+                "SELECT t.name, ut.user_id FROM user_tags ut JOIN tags t ON t.id = ut.tag_id "
+                "ORDER BY t.name, ut.user_id"
+            )
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        postings = {}
+        user_tags = {}
+        for r in rows:
+            postings.setdefault(r["name"], array("l")).append(r["user_id"])
+            user_tags.setdefault(r["user_id"], set()).add(r["name"])
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._postings = postings
+            self._user_tags = user_tags
+            for user_id, names in pending.items():
+                self._apply(user_id, names)
+            self.built_at = time.time()
+            self.build_ms = (time.perf_counter() - started) * 1000
+            self.builds += 1
+
+    def is_stale(self, max_age):
+        return self.built_at is None or (max_age and time.time() - self.built_at > max_age)
+
+    def set_user(self, user_id, names):
+        """Replace `user_id`'s tags with `names` (canonical tag names)."""
+        names = set(names)
+        with self._lock:
+            if self._pending is not None:
+                self._pending[user_id] = names
+            if self.built_at is not None:
+                self._apply(user_id, names)
+
+    def _apply(self, user_id, names):
+        old = self._user_tags.pop(user_id, set())
+        for name in old - names:
+            ids = self._postings[name]
+            del ids[bisect_left(ids, user_id)]
+            if not ids:
+                del self._postings[name]
+        for name in names - old:
+            insort(self._postings.setdefault(name, array("l")), user_id)
+        if names:
+            self._user_tags[user_id] = names
+
+    def union(self, names):
+        """Sorted ids of users having at least one of `names`."""
+        with self._lock:
+            lists = [self._postings[n] for n in set(names) if n in self._postings]
+            result = []
+            for uid in merge(*lists):
+                if not result or result[-1] != uid:
+                    result.append(uid)
+        return result
+
+    def intersect(self, names):
+        """Sorted ids of users having every one of `names`."""
+        with self._lock:
+            lists = [self._postings.get(n) for n in set(names)]
+            if not lists or any(ids is None for ids in lists):
+                return []
+            lists.sort(key=len)
+            result = list(lists[0])
+            for ids in lists[1:]:
+                result = [uid for uid in result if _contains(ids, uid)]
+                if not result:
+                    break
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tags": len(self._postings),
+                "users": len(self._user_tags),
+                "postings": sum(len(ids) for ids in self._postings.values()),
+                "bytes": sum(ids.buffer_info()[1] * ids.itemsize for ids in self._postings.values()),
+                "build_ms": None if self.build_ms is None else round(self.build_ms, 2),
+                "age_s": None if self.built_at is None else round(time.time() - self.built_at, 1),
+                "builds": self.builds,
+                "refreshing": self.refreshing,
+            }
+
+
+def _contains(ids, uid):
+    i = bisect_left(ids, uid)
+    return i < len(ids) and ids[i] == uid
+
+
+def get_tag_index(app=None):
+    """
+    The app's TagIndex. The first call builds it (concurrent callers wait for that build); once it
+    is older than TAG_INDEX_MAX_AGE a background refresh starts and the current copy is returned.
+    """
+    app = app or current_app._get_current_object()
+    index = app.extensions.setdefault("tag_index", TagIndex())
+    if index.built_at is None:
+        index.ensure_built()
+    elif index.is_stale(app.config.get("TAG_INDEX_MAX_AGE", 300)):
+        index.refresh_in_background(app)
+    return index
+
+
+def update_user_tags(user_id, names):
+    """Apply a user's new tag set to this process's index (no-op until the index is first built)."""
+    index = current_app.extensions.get("tag_index")
+    if index is not None:
+        index.set_user(user_id, names)
@@ -1,6 +1,7 @@
 """Tag names: canonical storage (no #), optional # in user input, # prefix in UI."""
 
 import re
+from app.database import execute, commit
 
 # Commas, semicolons, pipes, or any run of whitespace between tags.
 _SPLIT_PATTERN = re.compile(r"[,;\s|]+")
@@ -39,3 +40,40 @@ def tags_display_form_value(tags):
         if name:
             parts.append("#" + name)
     return ", ".join(parts)
+
+
+def tag_mask(tag_ids):
+    """Bitmask with bit `tag_id` set for every tag id (users.tag_mask in integer form)."""
+    mask = 0
+    for tag_id in tag_ids:
+        mask |= 1 << tag_id
+    return mask
+
+
+def mask_to_bits(mask):
+    """users.tag_mask literal: character i (1-based, from the left) is tag id i."""
+    return bin(mask >> 1)[2:][::-1] if mask > 1 else ""
+
+
+def bits_to_mask(bits):
+    return int(bits[::-1], 2) << 1 if bits else 0
+
+
+def common_tag_count(mask_a, mask_b):
+    return bin(mask_a & mask_b).count("1")
+
+
+def backfill_tag_masks(recompute_all=False):
+    """Rebuild users.tag_mask from user_tags in one statement; returns the number of users updated."""
+    sql = (
+        "UPDATE users u SET tag_mask = COALESCE(("
+        "SELECT string_agg(CASE WHEN g = ANY(t.ids) THEN '1' ELSE '0' END, '' ORDER BY g) "
+        "FROM (SELECT array_agg(tag_id) AS ids, max(tag_id) AS top FROM user_tags "
+        "WHERE user_id = u.id) t, generate_series(1, t.top) g"
+        "), '')::bit varying"
+    )
+    if not recompute_all:
+        sql += " WHERE u.tag_mask IS NULL"
+    updated = execute(sql)
+    commit()
+    return updated
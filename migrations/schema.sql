@@ -32,6 +32,32 @@ CREATE TABLE IF NOT EXISTS users (
 
 CREATE INDEX IF NOT EXISTS ix_users_username ON users (username);
 CREATE INDEX IF NOT EXISTS ix_users_email ON users (email);
+CREATE INDEX IF NOT EXISTS ix_users_lat_lng ON users (latitude, longitude);
+
+-- Grid cell of (latitude, longitude), see app/utils/geocell.py; `flask backfill-geo-cells` fills old rows.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS geo_cell INTEGER;
+CREATE INDEX IF NOT EXISTS ix_users_geo_cell ON users (geo_cell);
+
+-- Inputs of fame_rating, kept in the same transaction as likes/profile_views writes (app/utils/fame.py);
+-- `flask reconcile-fame --fix` recomputes them from scratch.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS likes_received INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS views_received INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS connections INTEGER NOT NULL DEFAULT 0;
+-- FAME_MODE=batch: handlers only set fame_dirty; `flask recompute-fame` / the scheduler clear it.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS fame_dirty BOOLEAN NOT NULL DEFAULT FALSE;
+CREATE INDEX IF NOT EXISTS ix_users_fame_dirty ON users (id) WHERE fame_dirty;
+
+-- Compatibility bucket: gender index * 4 + preference index, both ordered as in the enums with NULL last
+-- (app/utils/matching.orientation_bucket). Generated, so every write of gender/sexual_preference
+-- keeps it current; candidate queries select `orientation_bucket = ANY(<compatible buckets>)`.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS orientation_bucket SMALLINT GENERATED ALWAYS AS (
+    (CASE gender WHEN 'male' THEN 0 WHEN 'female' THEN 1 WHEN 'other' THEN 2 ELSE 3 END) * 4
+    + (CASE sexual_preference WHEN 'heterosexual' THEN 0 WHEN 'homosexual' THEN 1
+       WHEN 'bisexual' THEN 2 ELSE 3 END)
+) STORED;
+CREATE INDEX IF NOT EXISTS ix_users_match_bucket ON users (orientation_bucket, email_verified)
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    AND (location_enabled = true OR btrim(COALESCE(location_place, '')) <> '');
 
 CREATE TABLE IF NOT EXISTS user_images (
     id SERIAL PRIMARY KEY,
@@ -63,6 +89,10 @@ CREATE TABLE IF NOT EXISTS user_tags (
 
 CREATE INDEX IF NOT EXISTS ix_user_tags_tag_id ON user_tags (tag_id);
 
+-- Interest tags as a bit string (character i = tag id i), kept by set_user_tags; NULL = not built yet
+-- (`flask backfill-tag-masks`). Overlap is bit_count(a & b) instead of a user_tags lookup.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS tag_mask BIT VARYING;
+
 CREATE TABLE IF NOT EXISTS likes (
     id SERIAL PRIMARY KEY,
     liker_id INTEGER NOT NULL REFERENCES users(id),
@@ -74,6 +104,14 @@ CREATE TABLE IF NOT EXISTS likes (
 CREATE INDEX IF NOT EXISTS ix_likes_liker_id ON likes (liker_id);
 CREATE INDEX IF NOT EXISTS ix_likes_liked_id ON likes (liked_id);
 
+-- Top co-liked users per liked user, rebuilt offline by `flask build-colike` (app/utils/colike.py).
+CREATE TABLE IF NOT EXISTS user_similar (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    similar_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    score INTEGER NOT NULL,
+    PRIMARY KEY (user_id, similar_id)
+);
+
 CREATE TABLE IF NOT EXISTS profile_views (
     id SERIAL PRIMARY KEY,
     viewer_id INTEGER NOT NULL REFERENCES users(id),
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Per-candidate memory of the matching candidate records, before and after Candidate.
+
+"before" replays the former path: SELECT u.* through RealDictCursor -> dict -> SimpleNamespace
+(+ a SimpleNamespace photo) wrapped in a result dict per candidate. "after" is
+get_matching_candidates(): a tuple cursor over CANDIDATE_COLUMNS -> Candidate (__slots__).
+Uses the bench database of scripts/bench_matching.py; --size reloads it first.
+
+    python scripts/bench_candidate_memory.py --size 100000
+"""
+import os
+import sys
+import gc
+import json
+import argparse
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.database import query_all
+from app.models import load_user
+from app.utils.matching import get_matching_candidates, _candidate_conditions
+from bench_matching import BenchConfig, _bench_db_url, load_population
+
+
+def _legacy_candidates(viewer):
+    where, params = _candidate_conditions(viewer, {})
+    rows = query_all(
+        "SELECT u.*, ui.filename AS pp_filename, ui.id AS pp_id "
+        "FROM users u LEFT JOIN user_images ui ON u.profile_picture_id = ui.id "
+        "WHERE " + " AND ".join(where),
+        params,
+    )
+    result = []
+    for row in rows:
+        pp = None
+        if row.get("pp_filename"):
+            pp = SimpleNamespace(id=row.get("pp_id"), filename=row["pp_filename"])
+        user = SimpleNamespace(**{k: v for k, v in row.items() if k not in ("pp_filename", "pp_id")})
+        user.profile_picture = pp
+        result.append({"user": user, "score": 0, "distance": None, "age": None, "common_tags": 0})
+    return result
+
+
+def _measure(fn):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        records = fn()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    n = len(records)
+    return {
+        "candidates": n,
+        "retained_bytes_per_candidate": round(retained / n, 1) if n else None,
+        "peak_bytes_per_candidate": round(peak / n, 1) if n else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, help="reload the bench database with this many users first")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=_bench_db_url())
+    args = parser.parse_args()
+
+    BenchConfig.DATABASE_URL = BenchConfig.SQLALCHEMY_DATABASE_URI = args.database_url
+    app = create_app(BenchConfig)
+    with app.app_context():
+        if args.size:
+            load_population(args.size, args.seed)
+        viewer_id = query_all(
+            "SELECT id FROM users WHERE email_verified AND location_enabled "
+            "AND sexual_preference = 'bisexual' ORDER BY id LIMIT 1"
+        )[0]["id"]
+        viewer = load_user(viewer_id)
+        report = {
+            "before": _measure(lambda: _legacy_candidates(viewer)),
+            "after": _measure(lambda: get_matching_candidates(viewer)),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Benchmark the matching code on synthetic populations.
+
+Each size is loaded into a dedicated database (by default DATABASE_URL with the database name
+replaced by matcha_bench; it is TRUNCATEd on every run), then get_matching_candidates, score_user
+and get_suggestions are timed for every engine, sort_by and filter set. Results are JSON:
+
+    python scripts/bench_matching.py --sizes 1000,10000 --runs 20 --output bench-1k-10k.json
+"""
+import os
+import sys
+import json
+import math
+import random
+import argparse
+import platform
+import subprocess
+import time
+from datetime import date, datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import current_app
+from app import create_app
+from app.config import Config
+from app.database import get_db, query_one, query_all, execute, commit, copy_rows, query_stats
+from app.models import load_user
+from app.utils.geocell import cell_key
+from app.utils.matching import (
+    get_matching_candidates, get_suggestions, get_tag_ids_for_users, score_user, np,
+)
+from app.utils.tags import backfill_tag_masks
+from seed_data import TAGS, PLACE_NAMES
+
+# (lat, lng, relative population); users cluster around these, the rest spread over the region.
+CITY_WEIGHTS = [
+    (48.8566, 2.3522, 22), (51.5074, -0.1278, 18), (52.5200, 13.4050, 10), (40.4168, -3.7038, 12),
+    (41.9028, 12.4964, 8), (45.4642, 9.1900, 6), (50.1109, 8.6821, 3), (47.3769, 8.5417, 3),
+    (46.2044, 6.1432, 2), (46.5197, 6.6323, 1), (45.7640, 4.8357, 3), (52.3676, 4.9041, 5),
+    (50.8503, 4.3517, 4), (48.1351, 11.5820, 4), (48.2082, 16.3738, 4), (53.3498, -6.2603, 3),
+]
+RURAL_SHARE = 0.1
+REGION = ((36.0, 58.0), (-9.0, 20.0))
+
+SORT_MODES = [None, "age", "location", "fame", "tags"]
+FILTER_SETS = {
+    "none": {},
+    "age": {"age_min": "25", "age_max": "35"},
+    "fame": {"fame_min": "20"},
+    "location": {"location_max": "50"},
+    "tags": {"tags": "music, travel, hiking"},
+    "all": {"age_min": "25", "age_max": "40", "fame_min": "5", "location_max": "100", "tags": "music, travel"},
+}
+
+USER_COLUMNS = (
+    "username", "email", "password_hash", "first_name", "last_name", "birth_date", "gender",
+    "sexual_preference", "latitude", "longitude", "geo_cell", "location_enabled", "location_place",
+    "fame_rating", "email_verified",
+)
+
+
+class BenchConfig(Config):
+    TESTING = True
+    SUGGESTIONS_CACHE_TTL = 0
+
+
+def _bench_db_url():
+    base = os.environ.get("DATABASE_URL", "postgresql://localhost/matcha_db")
+    return base.rsplit("/", 1)[0] + "/matcha_bench"
+
+
+def _synthetic_user(i, rng, today):
+    if rng.random() < RURAL_SHARE:
+        lat, lng = rng.uniform(*REGION[0]), rng.uniform(*REGION[1])
+    else:
+        city_lat, city_lng, _ = rng.choices(CITY_WEIGHTS, weights=[c[2] for c in CITY_WEIGHTS])[0]
+        lat, lng = rng.gauss(city_lat, 0.12), rng.gauss(city_lng, 0.18)
+    age = min(70, 18 + int(rng.gammavariate(2.5, 4.0)))
+    birth = date(today.year - age, rng.randint(1, 12), rng.randint(1, 28))
+    gender = rng.choices(["male", "female", "other"], weights=[48, 48, 4])[0]
+    preference = rng.choices(["heterosexual", "homosexual", "bisexual"], weights=[72, 11, 17])[0]
+    gps = rng.random() < 0.9
+    return (
+        f"bench{i}", f"bench{i}@example.com", "x", "Bench", f"User{i}", birth, gender, preference,
+        round(lat, 6), round(lng, 6), cell_key(lat, lng), gps,
+        "" if gps else rng.choice(PLACE_NAMES), min(5000, int(rng.paretovariate(1.4) * 8) - 8),
+        rng.random() < 0.97,
+    )
+
+
+def load_population(size, seed, chunk=100_000):
+    """TRUNCATE the bench database and COPY `size` users (ids 1..size) with 1-6 Zipf-distributed tags."""
+    rng = random.Random(seed)
+    today = date.today()
+    execute(
+        "TRUNCATE events, notifications, messages, reports, blocks, profile_views, likes, "
+        "user_tags, tags, user_images, users RESTART IDENTITY CASCADE"
+    )
+    copy_rows("tags", ("name",), [(t,) for t in TAGS])
+    tag_weights = [1 / (rank + 1) ** 0.8 for rank in range(len(TAGS))]
+    for start in range(0, size, chunk):
+        ids = range(start + 1, min(size, start + chunk) + 1)
+        copy_rows("users", USER_COLUMNS, [_synthetic_user(i, rng, today) for i in ids])
+        pairs = []
+        for uid in ids:
+            tags = set(rng.choices(range(1, len(TAGS) + 1), weights=tag_weights, k=rng.randint(1, 6)))
+            pairs.extend((uid, t) for t in tags)
+        copy_rows("user_tags", ("user_id", "tag_id"), pairs)
+        commit()
+    backfill_tag_masks(recompute_all=True)
+    execute("ANALYZE")
+    commit()
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def _timed(fn):
+    query_stats(reset=True)
+    started = time.perf_counter()
+    result = fn()
+    elapsed = (time.perf_counter() - started) * 1000
+    return result, elapsed, query_stats()
+
+
+def _summarize(size, op, samples, **labels):
+    ms = [s[0] for s in samples]
+    return {
+        "size": size, "op": op, **labels, "runs": len(samples),
+        "p50_ms": round(_percentile(ms, 50), 3), "p95_ms": round(_percentile(ms, 95), 3),
+        "mean_ms": round(sum(ms) / len(ms), 3),
+        "rows_returned": round(sum(s[1] for s in samples) / len(samples), 1),
+        "rows_fetched": round(sum(s[2]["rows"] for s in samples) / len(samples), 1),
+        "queries": round(sum(s[2]["queries"] for s in samples) / len(samples), 2),
+    }
+
+
+def bench_size(size, args, results):
+    current_app.extensions.pop("tag_index", None)
+    viewers = [
+        load_user(r["id"]) for r in query_all(
+            "SELECT id FROM users WHERE email_verified AND location_enabled "
+            "ORDER BY md5(id::text || %s) LIMIT %s",
+            (str(args.seed), args.viewers),
+        )
+    ]
+
+    def run(op, fn, **labels):
+        fn(viewers[0])  # warm-up (tag index build, plan cache)
+        samples = []
+        for i in range(args.runs):
+            result, ms, stats = _timed(lambda: fn(viewers[i % len(viewers)]))
+            samples.append((ms, len(result), stats))
+        results.append(_summarize(size, op, samples, **labels))
+        print(f"  {op} {labels} p50={results[-1]['p50_ms']}ms", file=sys.stderr)
+
+    for name, filters in FILTER_SETS.items():
+        run("get_matching_candidates", lambda me: get_matching_candidates(me, filters), filters=name)
+
+    users = get_matching_candidates(viewers[0])[:args.score_sample]
+    tags = get_tag_ids_for_users([u.id for u in users])
+    my_tags = get_tag_ids_for_users([viewers[0].id])[viewers[0].id]
+    samples = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        for u in users:
+            score_user(u, viewers[0], my_tags, tags[u.id])
+        samples.append(((time.perf_counter() - started) * 1000, len(users), {"queries": 0, "rows": 0}))
+    results.append(_summarize(size, "score_user", samples, calls_per_run=len(users)))
+
+    for engine in args.engines:
+        for sort_by in SORT_MODES:
+            for name, filters in FILTER_SETS.items():
+                run(
+                    "get_suggestions",
+                    lambda me: get_suggestions(me, sort_by, filters, limit=args.limit, engine=engine),
+                    engine=engine, sort_by=sort_by, filters=name,
+                )
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--engines", default="python,numpy,sql")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--viewers", type=int, default=5, help="viewers cycled through the runs")
+    parser.add_argument("--limit", type=int, default=20, help="suggestions page size")
+    parser.add_argument("--score-sample", type=int, default=1000, help="candidates per score_user run")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=_bench_db_url())
+    parser.add_argument("--prepared-statements", action="store_true", help="run with PREPARED_STATEMENTS on")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+    args.engines = args.engines.split(",")
+
+    BenchConfig.DATABASE_URL = BenchConfig.SQLALCHEMY_DATABASE_URI = args.database_url
+    BenchConfig.PREPARED_STATEMENTS = args.prepared_statements
+    app = create_app(BenchConfig)
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__ if np is not None else None,
+            "runs": args.runs, "viewers": args.viewers, "limit": args.limit, "seed": args.seed,
+            "prepared_statements": args.prepared_statements,
+        },
+        "results": [],
+    }
+    with app.app_context():
+        schema = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations", "schema.sql")
+        with open(schema) as f, get_db().cursor() as cur:
+            cur.execute(f.read())
+        commit()
+        for size in (int(s) for s in args.sizes.split(",")):
+            print(f"Loading {size} users...", file=sys.stderr)
+            started = time.perf_counter()
+            load_population(size, args.seed)
+            report["results"].append({
+                "size": size, "op": "load_population",
+                "seconds": round(time.perf_counter() - started, 2),
+                "users": query_one("SELECT COUNT(*) AS cnt FROM users")["cnt"],
+            })
+            bench_size(size, args, report["results"])
+    out = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
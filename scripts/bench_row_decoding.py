@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Row decoding cost of query_all: RealDictCursor + dict copies vs tuple cursor + Row.
+
+"dict" replays the former query_all (RealDictCursor, then dict(row) per row), "dict+namespace"
+adds the SimpleNamespace(**row) wrapping templates used to get, "row" is query_all() today.
+Each is timed end to end on SELECT * FROM users LIMIT --rows, and once more reading one column
+per row by attribute (row.username / namespace.username). Uses the bench database of
+scripts/bench_matching.py; --size reloads it first.
+
+    python scripts/bench_row_decoding.py --rows 10000 --runs 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from psycopg2.extras import RealDictCursor
+from app import create_app
+from app.database import get_db, query_all
+from bench_matching import BenchConfig, _bench_db_url, _git_revision, _percentile, load_population
+
+SQL = "SELECT * FROM users ORDER BY id LIMIT %s"
+
+
+def _dict_rows(limit):
+    with get_db().cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(SQL, (limit,))
+        return [dict(r) for r in cur.fetchall()]
+
+
+def _namespace_rows(limit):
+    return [SimpleNamespace(**r) for r in _dict_rows(limit)]
+
+
+def _read_attribute(rows):
+    for r in rows:
+        r.username
+
+
+def _time(fn, runs):
+    fn()
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"p50_ms": round(_percentile(samples, 50), 3), "min_ms": round(min(samples), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, help="reload the bench database with this many users first")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=_bench_db_url())
+    args = parser.parse_args()
+
+    BenchConfig.DATABASE_URL = BenchConfig.SQLALCHEMY_DATABASE_URI = args.database_url
+    app = create_app(BenchConfig)
+    paths = {
+        "dict": lambda: _dict_rows(args.rows),
+        "dict+namespace": lambda: _namespace_rows(args.rows),
+        "row": lambda: query_all(SQL, (args.rows,)),
+    }
+    report = {
+        "meta": {
+            "revision": _git_revision(), "python": platform.python_version(),
+            "rows": args.rows, "runs": args.runs,
+        },
+        "results": {},
+    }
+    with app.app_context():
+        if args.size:
+            load_population(args.size, args.seed)
+        # Every path decodes the same rows: SELECT * over the bench users.
+        report["meta"]["columns"] = len(query_all(SQL, (1,))[0])
+        for name, fetch in paths.items():
+            rows = fetch()
+            report["results"][name] = {
+                "fetched": len(rows),
+                "fetch": _time(fetch, args.runs),
+                "attribute_read": _time(lambda: _read_attribute(rows), args.runs) if name != "dict" else None,
+            }
+            print(f"  {name}: {report['results'][name]}", file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
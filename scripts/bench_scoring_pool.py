@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Crossover between in-process and process-pool scoring (python engine).
+
+Ranks the first N candidates of one unfiltered viewer with _rank_rows (one process) and
+_rank_parallel (SCORING_WORKERS processes) for growing N, and reports the smallest N from which
+the pool is faster at every larger size: a starting point for SCORING_PARALLEL_THRESHOLD on that
+machine. Uses the bench database of scripts/bench_matching.py; --size reloads it first.
+
+    python scripts/bench_scoring_pool.py --size 200000 --workers 2,4 --output pool.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.database import query_one
+from app.models import load_user
+from app.utils.matching import get_matching_candidates, _rank_rows, _rank_parallel
+from app.utils.scoring_pool import start_scoring_pool
+from bench_matching import BenchConfig, _bench_db_url, _git_revision, _percentile, load_population
+
+
+def _p50(fn, runs):
+    fn()
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(_percentile(samples, 50), 3)
+
+
+def _crossover(points):
+    """Smallest candidate count from which the pool wins at every measured size, or None."""
+    crossover = None
+    for p in reversed(points):
+        if p["parallel_ms"] >= p["serial_ms"]:
+            break
+        crossover = p["candidates"]
+    return crossover
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, help="reload the bench database with this many users first")
+    parser.add_argument("--counts", default="1000,2500,5000,10000,20000,40000,80000")
+    parser.add_argument("--workers", default="2,4")
+    parser.add_argument("--sort-by", default=None)
+    parser.add_argument("--limit", type=int, default=21, help="rows ranked per call (page size + 1)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=_bench_db_url())
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    BenchConfig.DATABASE_URL = BenchConfig.SQLALCHEMY_DATABASE_URI = args.database_url
+    app = create_app(BenchConfig)
+    report = {
+        "meta": {
+            "revision": _git_revision(), "python": platform.python_version(), "cpus": os.cpu_count(),
+            "runs": args.runs, "limit": args.limit, "sort_by": args.sort_by,
+        },
+        "results": [],
+    }
+    with app.app_context():
+        if args.size:
+            load_population(args.size, args.seed)
+        viewer = load_user(query_one(
+            "SELECT id FROM users WHERE email_verified AND location_enabled "
+            "AND sexual_preference = 'bisexual' ORDER BY id LIMIT 1"
+        )["id"])
+        rows = get_matching_candidates(viewer)
+        counts = [c for c in (int(c) for c in args.counts.split(",")) if c <= len(rows)]
+        serial = {
+            n: _p50(lambda: _rank_rows(viewer, rows[:n], args.sort_by, {}, k=args.limit), args.runs)
+            for n in counts
+        }
+        for workers in (int(w) for w in args.workers.split(",")):
+            app.config["SCORING_WORKERS"] = workers
+            started = time.perf_counter()
+            pool = start_scoring_pool(app, workers)
+            startup_ms = round((time.perf_counter() - started) * 1000, 1)
+            points = []
+            for n in counts:
+                parallel = _p50(
+                    lambda: _rank_parallel(pool, viewer, rows[:n], args.sort_by, {}, k=args.limit), args.runs
+                )
+                points.append({"candidates": n, "serial_ms": serial[n], "parallel_ms": parallel})
+                print(f"  workers={workers} n={n} serial={serial[n]}ms parallel={parallel}ms", file=sys.stderr)
+            pool.shutdown()
+            report["results"].append({
+                "workers": workers, "startup_ms": startup_ms, "points": points,
+                "crossover_candidates": _crossover(points),
+            })
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
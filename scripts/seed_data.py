@@ -13,7 +13,12 @@ from PIL import Image, ImageDraw, ImageFont
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import create_app, bcrypt
-from app.database import query_one, query_all, execute, execute_returning, commit
+from app.database import (
+    query_one, query_all, query_iter, execute, execute_returning, execute_values, copy_rows, commit,
+)
+from app.utils.fame import recompute_fame
+from app.utils.geocell import cell_key
+from app.utils.tags import backfill_tag_masks
 
 FIRST_NAMES_M = [
     "James", "John", "Robert", "Michael", "David", "William", "Richard", "Joseph",
@@ -89,10 +94,7 @@ AVATAR_COLORS = [
 
 
 def create_tags():
-    for tag_name in TAGS:
-        existing = query_one("SELECT id FROM tags WHERE name = %s", (tag_name,))
-        if not existing:
-            execute("INSERT INTO tags (name) VALUES (%s)", (tag_name,))
+    execute_values("INSERT INTO tags (name) VALUES %s ON CONFLICT (name) DO NOTHING", [(t,) for t in TAGS])
     commit()
     return query_all("SELECT id, name FROM tags")
 
@@ -135,14 +137,14 @@ def create_users(count=500):
         place_label = PLACE_NAMES[i % len(PLACE_NAMES)]
         row = execute_returning(
             "INSERT INTO users (username, email, password_hash, first_name, last_name, "
-            "birth_date, gender, sexual_preference, biography, latitude, longitude, "
+            "birth_date, gender, sexual_preference, biography, latitude, longitude, geo_cell, "
             "location_enabled, location_place, fame_rating, email_verified, is_online, last_seen) "
-            "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,true,%s,%s,true,%s,%s) RETURNING id",
+            "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,true,%s,%s,true,%s,%s) RETURNING id",
             (
                 username, email, password_hash, first_name, last_name,
                 random_date(), gender,
                 random.choice(["heterosexual", "homosexual", "bisexual"]),
-                random.choice(BIOS), lat, lon,
+                random.choice(BIOS), lat, lon, cell_key(lat, lon),
                 place_label,
                 random.randint(0, 100), random.choice([True, False]), last_seen,
             ),
@@ -153,15 +155,12 @@ def create_users(count=500):
             print(f"Created {len(users)} users...")
     commit()
     print(f"Total users created: {len(users)}")
-    for u in users:
-        num_tags = random.randint(2, 6)
-        selected = random.sample(all_tags, num_tags)
-        for tag in selected:
-            execute(
-                "INSERT INTO user_tags (user_id, tag_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-                (u["id"], tag["id"]),
-            )
+    execute_values(
+        "INSERT INTO user_tags (user_id, tag_id) VALUES %s ON CONFLICT DO NOTHING",
+        [(u["id"], tag["id"]) for u in users for tag in random.sample(all_tags, random.randint(2, 6))],
+    )
     commit()
+    backfill_tag_masks()
     print("Tags assigned to users.")
     return users
 
@@ -184,64 +183,62 @@ def create_avatar_file(filepath, initials, color):
 
 def create_profile_images_for_users():
     from flask import current_app
-    users_without_images = query_all(
+    users_without_images = query_iter(
         "SELECT id, first_name, last_name FROM users "
-        "WHERE id NOT IN (SELECT user_id FROM user_images)"
+        "WHERE id NOT IN (SELECT user_id FROM user_images) ORDER BY id"
     )
-    if not users_without_images:
-        print("No users without images found.")
-        return 0
     upload_folder = current_app.config.get("UPLOAD_FOLDER", "./app/uploads")
     if not os.path.exists(upload_folder):
         os.makedirs(upload_folder)
     created = 0
-    for row in users_without_images:
-        first = (row["first_name"] or "").strip()
-        last = (row["last_name"] or "").strip()
+    for user_id, first, last in users_without_images:
+        first = (first or "").strip()
+        last = (last or "").strip()
         initials = ((first[:1] or "U") + (last[:1] or "")).upper()
-        color = AVATAR_COLORS[row["id"] % len(AVATAR_COLORS)]
+        color = AVATAR_COLORS[user_id % len(AVATAR_COLORS)]
         filename = f"{uuid.uuid4().hex}.png"
         filepath = os.path.join(upload_folder, filename)
         create_avatar_file(filepath, initials, color)
         image_row = execute_returning(
             "INSERT INTO user_images (user_id, filename, is_profile_picture, upload_order) "
             "VALUES (%s, %s, true, 0) RETURNING id",
-            (row["id"], filename),
+            (user_id, filename),
         )
         execute(
             "UPDATE users SET profile_picture_id = %s WHERE id = %s",
-            (image_row["id"], row["id"]),
+            (image_row["id"], user_id),
         )
         created += 1
         if created % 100 == 0:
             commit()
             print(f"Created {created} profile images...")
     commit()
+    if not created:
+        print("No users without images found.")
+        return 0
     print(f"Total profile images created: {created}")
     return created
 
 
 def assign_real_photos_to_seeded_users():
     from flask import current_app
-    users = query_all(
-        "SELECT u.id, u.gender, u.profile_picture_id, ui.filename "
+    users = query_iter(
+        "SELECT u.id, u.gender, ui.filename "
         "FROM users u "
         "LEFT JOIN user_images ui ON ui.id = u.profile_picture_id "
         "WHERE u.email LIKE %s "
         "ORDER BY u.id",
         ("%@example.com",),
     )
-    if not users:
-        print("No seeded users found for real photo assignment.")
-        return 0
     upload_folder = current_app.config.get("UPLOAD_FOLDER", "./app/uploads")
     if not os.path.exists(upload_folder):
         os.makedirs(upload_folder)
-    updated = 0
+    seen = updated = 0
     ssl_context = ssl._create_unverified_context()
-    for idx, row in enumerate(users):
-        photo_idx = (row["id"] + idx) % 100
-        if row["gender"] == "female":
+    for idx, (user_id, gender, filename) in enumerate(users):
+        seen += 1
+        photo_idx = (user_id + idx) % 100
+        if gender == "female":
             source_url = f"https://randomuser.me/api/portraits/women/{photo_idx}.jpg"
         else:
             source_url = f"https://randomuser.me/api/portraits/men/{photo_idx}.jpg"
@@ -251,17 +248,16 @@ def assign_real_photos_to_seeded_users():
             img = Image.open(io.BytesIO(data)).convert("RGB")
         except Exception:
             continue
-        filename = row["filename"]
         if not filename:
             filename = f"{uuid.uuid4().hex}.jpg"
             image_row = execute_returning(
                 "INSERT INTO user_images (user_id, filename, is_profile_picture, upload_order) "
                 "VALUES (%s, %s, true, 0) RETURNING id",
-                (row["id"], filename),
+                (user_id, filename),
             )
             execute(
                 "UPDATE users SET profile_picture_id = %s WHERE id = %s",
-                (image_row["id"], row["id"]),
+                (image_row["id"], user_id),
             )
         filepath = os.path.join(upload_folder, filename)
         img.thumbnail((1200, 1200), Image.Resampling.LANCZOS)
@@ -271,52 +267,46 @@ def assign_real_photos_to_seeded_users():
             commit()
             print(f"Assigned {updated} real profile photos...")
     commit()
+    if not seen:
+        print("No seeded users found for real photo assignment.")
+        return 0
     print(f"Total seeded users with real photos: {updated}")
     return updated
 
 
 def create_interactions(users, like_count=2000, view_count=5000):
     user_ids = [u["id"] for u in users]
-    likes_created = 0
+    pairs = set()
     for _ in range(like_count):
-        liker_id = random.choice(user_ids)
-        liked_id = random.choice(user_ids)
-        if liker_id == liked_id:
-            continue
-        existing = query_one(
-            "SELECT id FROM likes WHERE liker_id=%s AND liked_id=%s", (liker_id, liked_id)
-        )
-        if existing:
-            continue
-        execute("INSERT INTO likes (liker_id, liked_id) VALUES (%s, %s)", (liker_id, liked_id))
-        likes_created += 1
-        if likes_created % 500 == 0:
-            commit()
+        liker_id, liked_id = random.choice(user_ids), random.choice(user_ids)
+        if liker_id != liked_id:
+            pairs.add((liker_id, liked_id))
+    likes_created = execute_values(
+        "INSERT INTO likes (liker_id, liked_id) VALUES %s ON CONFLICT DO NOTHING", pairs, page_size=5000
+    )
     commit()
     print(f"Created {likes_created} likes.")
-    views_created = 0
     now = datetime.now(timezone.utc).replace(tzinfo=None)
-    for _ in range(view_count):
-        viewer_id = random.choice(user_ids)
-        viewed_id = random.choice(user_ids)
-        if viewer_id == viewed_id:
-            continue
-        viewed_at = now - timedelta(minutes=random.randint(0, 43200))
-        execute(
-            "INSERT INTO profile_views (viewer_id, viewed_id, viewed_at) VALUES (%s, %s, %s)",
-            (viewer_id, viewed_id, viewed_at),
+    views = (
+        (viewer_id, viewed_id, now - timedelta(minutes=random.randint(0, 43200)))
+        for viewer_id, viewed_id in (
+            (random.choice(user_ids), random.choice(user_ids)) for _ in range(view_count)
         )
-        views_created += 1
-        if views_created % 1000 == 0:
-            commit()
+        if viewer_id != viewed_id
+    )
+    views_created = copy_rows("profile_views", ("viewer_id", "viewed_id", "viewed_at"), views)
     commit()
     print(f"Created {views_created} profile views.")
+    print(f"Recomputed fame for {recompute_fame(recompute_all=True)} users.")
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--images-only", action="store_true")
     parser.add_argument("--real-photos", action="store_true")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--likes", type=int, default=2000, help="like attempts (self/duplicate likes dropped)")
+    parser.add_argument("--views", type=int, default=5000)
     args = parser.parse_args()
     app = create_app()
     with app.app_context():
@@ -331,9 +321,9 @@ def main():
             print("Image generation complete!")
             return
         print("Starting seed data generation...")
-        users = create_users(500)
+        users = create_users(args.users)
         if users:
-            create_interactions(users)
+            create_interactions(users, args.likes, args.views)
         create_profile_images_for_users()
         print("Seed data generation complete!")
 
@@ -47,7 +47,7 @@ def app():
         with conn.cursor() as cur:
             cur.execute(
                 "DROP TABLE IF EXISTS events, notifications, messages, reports, "
-                "blocks, profile_views, likes, user_tags, tags CASCADE"
+                "blocks, profile_views, user_similar, likes, user_tags, tags CASCADE"
             )
             cur.execute("ALTER TABLE users DROP CONSTRAINT IF EXISTS fk_users_profile_picture")
             cur.execute("DROP TABLE IF EXISTS user_images CASCADE")
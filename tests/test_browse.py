@@ -35,6 +35,25 @@ class TestLike:
             )
             assert like is not None
 
+    def test_concurrent_reciprocal_like_is_match(self, logged_in_client, user, user2, app):
+        import threading
+        from app import database
+        other = database.get_raw_conn()
+        with other.cursor() as cur:
+            # user2's like of user, still uncommitted while user likes back.
+            cur.execute("SELECT pg_advisory_xact_lock(%s, %s)", (min(user, user2), max(user, user2)))
+            cur.execute("INSERT INTO likes (liker_id, liked_id) VALUES (%s, %s)", (user2, user))
+        committer = threading.Timer(0.3, other.commit)
+        committer.start()
+        logged_in_client.post(f"/browse/like/{user2}")
+        committer.join()
+        other.close()
+        with app.app_context():
+            assert query_one("SELECT connections FROM users WHERE id = %s", (user,))["connections"] == 1
+            assert query_one(
+                "SELECT COUNT(*) AS cnt FROM notifications WHERE type = 'match'"
+            )["cnt"] == 2
+
     def test_cannot_like_self(self, logged_in_client, user, app):
         response = logged_in_client.post(
             f"/browse/like/{user}",
@@ -81,6 +100,45 @@ class TestBlock:
             )
             assert block is not None
 
+    def test_block_waits_for_concurrent_like(self, logged_in_client, user, user2, app):
+        import threading
+        from app import database
+        other = database.get_raw_conn()
+        with other.cursor() as cur:
+            # user2's like of user, still uncommitted while user blocks them.
+            cur.execute("SELECT pg_advisory_xact_lock(%s, %s)", (min(user, user2), max(user, user2)))
+            cur.execute("INSERT INTO likes (liker_id, liked_id) VALUES (%s, %s)", (user2, user))
+        committer = threading.Timer(0.3, other.commit)
+        committer.start()
+        logged_in_client.post(f"/browse/block/{user2}")
+        committer.join()
+        other.close()
+        with app.app_context():
+            assert query_one("SELECT COUNT(*) AS cnt FROM likes")["cnt"] == 0
+
+    def test_block_set_cached_and_invalidated(self, logged_in_client, user, user2, app):
+        from app.utils.blocks import get_block_set, is_blocked
+        with app.app_context():
+            assert not is_blocked(user, user2)
+            execute("INSERT INTO blocks (blocker_id, blocked_id) VALUES (%s, %s)", (user2, user))
+            commit()
+            assert not is_blocked(user, user2)
+            assert is_blocked(user2, user)
+        logged_in_client.post(f"/browse/block/{user2}")
+        with app.app_context():
+            assert is_blocked(user, user2) and is_blocked(user2, user)
+            assert get_block_set(user) == {user2}
+
+    def test_blocked_chat_send(self, logged_in_client, user, user2, app):
+        with app.app_context():
+            execute("INSERT INTO likes (liker_id, liked_id) VALUES (%s, %s), (%s, %s)", (user, user2, user2, user))
+            commit()
+        assert logged_in_client.get("/chat/").data.count(b"Test2") >= 1
+        logged_in_client.post(f"/browse/block/{user2}")
+        response = logged_in_client.post("/chat/send", json={"receiver_id": user2, "content": "hi"})
+        assert response.status_code == 403
+        assert b"Test2" not in logged_in_client.get("/chat/").data
+
     def test_cannot_like_blocked_user(self, logged_in_client, user, user2, app):
         with app.app_context():
             execute(
@@ -93,3 +151,174 @@ class TestBlock:
             follow_redirects=True,
         )
         assert b"cannot like" in response.data
+
+    def test_call_request_uses_session_and_respects_block(self, monkeypatch, logged_in_client, user, user2, app):
+        from flask import g
+        from flask_login import login_user
+        from app.models import load_user
+        from app.routes import videochat
+        sent = []
+        monkeypatch.setattr(videochat, "emit", lambda event, payload, room: sent.append((payload, room)))
+        with app.test_request_context():
+            videochat.handle_call_request({"target_user_id": user2, "caller_id": user, "room": "r"})
+            login_user(load_user(user))
+            videochat.handle_call_request({"target_user_id": "oops", "room": "r"})
+            videochat.handle_call_request({"target_user_id": user2, "caller_id": user2, "room": "r"})
+            # The fixture's app context outlives this request, so drop the user Flask-Login cached in g.
+            g.pop("_login_user")
+        assert sent == [({"caller_id": user, "caller_name": None, "room": "r"}, f"user_{user2}")]
+        logged_in_client.post(f"/browse/block/{user2}")
+        with app.test_request_context():
+            login_user(load_user(user))
+            videochat.handle_call_request({"target_user_id": user2, "room": "r"})
+            g.pop("_login_user")
+        assert len(sent) == 1
+
+class TestFame:
+    def _fame(self, app, user_id):
+        with app.app_context():
+            return query_one(
+                "SELECT likes_received, views_received, connections, fame_rating FROM users WHERE id = %s",
+                (user_id,),
+            )
+
+    def test_like_match_unlike_block(self, logged_in_client, user, user2, app):
+        from app.utils.fame import reconcile_fame
+        with app.app_context():
+            execute("INSERT INTO likes (liker_id, liked_id) VALUES (%s, %s)", (user2, user))
+            commit()
+            assert [r["id"] for r in reconcile_fame(fix=True)] == [user]
+        logged_in_client.post(f"/browse/like/{user2}")
+        assert self._fame(app, user) == {
+            "likes_received": 1, "views_received": 0, "connections": 1, "fame_rating": 30,
+        }
+        assert self._fame(app, user2)["fame_rating"] == 30
+        logged_in_client.post(f"/browse/unlike/{user2}")
+        assert self._fame(app, user2)["fame_rating"] == 0
+        assert self._fame(app, user)["fame_rating"] == 10
+        logged_in_client.post(f"/browse/like/{user2}")
+        logged_in_client.post(f"/browse/block/{user2}")
+        assert self._fame(app, user)["fame_rating"] == 0
+        assert self._fame(app, user2)["fame_rating"] == 0
+        with app.app_context():
+            assert reconcile_fame() == []
+
+    def test_view_counts(self, logged_in_client, user2, app):
+        from app.utils.fame import reconcile_fame
+        logged_in_client.get(f"/profile/view/{user2}")
+        logged_in_client.get(f"/profile/view/{user2}")
+        assert self._fame(app, user2)["views_received"] == 2
+        with app.app_context():
+            assert reconcile_fame() == []
+
+    def test_reconcile_command(self, runner, user, user2, app):
+        with app.app_context():
+            execute("INSERT INTO profile_views (viewer_id, viewed_id) VALUES (%s, %s)", (user, user2))
+            commit()
+            result = runner.invoke(args=["reconcile-fame"])
+            assert f"user {user2}: likes 0->0, views 0->1" in result.output
+            assert "1 users drifted." in result.output
+            result = runner.invoke(args=["reconcile-fame", "--fix"])
+            assert "1 users drifted, fixed." in result.output
+            assert runner.invoke(args=["reconcile-fame"]).output == "0 users drifted.\n"
+        assert self._fame(app, user2)["fame_rating"] == 1
+
+    def test_batch_mode_marks_dirty(self, logged_in_client, runner, user, user2, app):
+        from app.utils.fame import reconcile_fame
+        app.config["FAME_MODE"] = "batch"
+        logged_in_client.post(f"/browse/like/{user2}")
+        logged_in_client.get(f"/profile/view/{user2}")
+        assert self._fame(app, user2)["fame_rating"] == 0
+        with app.app_context():
+            dirty = query_one("SELECT array_agg(id) AS ids FROM users WHERE fame_dirty")["ids"]
+            assert dirty == [user2]
+            result = runner.invoke(args=["recompute-fame"])
+            assert "Fame recomputed for 1 users." in result.output
+            assert reconcile_fame() == []
+        assert self._fame(app, user2) == {
+            "likes_received": 1, "views_received": 1, "connections": 0, "fame_rating": 11,
+        }
+
+    def test_view_during_recompute_stays_dirty(self, monkeypatch, user, user2, app):
+        import threading
+        from app import database
+        from app.utils import fame
+        app.config["FAME_MODE"] = "batch"
+        with app.app_context():
+            execute("INSERT INTO likes (liker_id, liked_id) VALUES (%s, %s)", (user, user2))
+            execute("UPDATE users SET fame_dirty = true WHERE id = %s", (user2,))
+            commit()
+        other = database.get_raw_conn()
+
+        def view_and_mark():
+            with other.cursor() as cur:
+                cur.execute("INSERT INTO profile_views (viewer_id, viewed_id) VALUES (%s, %s)", (user, user2))
+                # Blocks on the row the claim locked until the recompute commits.
+                cur.execute("UPDATE users SET fame_dirty = true WHERE id = %s", (user2,))
+            other.commit()
+
+        racer = threading.Thread(target=view_and_mark)
+        claim = fame._claim_dirty
+
+        def claim_then_view(recompute_all):
+            claimed = claim(recompute_all)
+            racer.start()
+            racer.join(0.3)
+            return claimed
+
+        monkeypatch.setattr(fame, "_claim_dirty", claim_then_view)
+        with app.app_context():
+            assert fame.recompute_fame() == 1
+        racer.join()
+        other.close()
+        monkeypatch.undo()
+        assert self._fame(app, user2)["views_received"] == 0
+        with app.app_context():
+            assert query_one("SELECT fame_dirty FROM users WHERE id = %s", (user2,))["fame_dirty"]
+            assert fame.recompute_fame() == 1
+        assert self._fame(app, user2) == {
+            "likes_received": 1, "views_received": 1, "connections": 0, "fame_rating": 11,
+        }
+
+
+class TestSuggestionCache:
+    def test_page_change_served_from_cache(self, logged_in_client, user2, app):
+        from app.utils.suggestion_cache import get_cache_stats
+        with app.app_context():
+            before = get_cache_stats()
+        logged_in_client.get("/browse/suggestions")
+        logged_in_client.get("/browse/suggestions?page=2")
+        with app.app_context():
+            after = get_cache_stats()
+        assert after["misses"] - before["misses"] == 1
+        assert after["hits"] - before["hits"] == 1
+
+    def test_block_invalidates(self, logged_in_client, user2):
+        assert b"@testuser2" in logged_in_client.get("/browse/suggestions").data
+        logged_in_client.post(f"/browse/block/{user2}")
+        assert b"@testuser2" not in logged_in_client.get("/browse/suggestions").data
+
+    def test_stale_without_invalidation(self, app, user, user2):
+        from app.models import load_user
+        from app.utils.suggestion_cache import ranked_page, invalidate_suggestions
+        with app.app_context():
+            me = load_user(user)
+            assert [r["user"].id for r in ranked_page(me)[0]] == [user2]
+            execute("INSERT INTO blocks (blocker_id, blocked_id) VALUES (%s, %s)", (user, user2))
+            commit()
+            assert [r["user"].id for r in ranked_page(me)[0]] == [user2]
+            invalidate_suggestions(user)
+            assert ranked_page(me) == ([], 0, None)
+
+
+class TestMetrics:
+    def test_disabled_by_default(self, client):
+        assert client.get("/metrics/").status_code == 404
+
+    def test_enabled(self, client, app):
+        app.config["METRICS_ENABLED"] = True
+        data = client.get("/metrics/").get_json()
+        assert "hit_ratio" in data["suggestions_cache"]
+        assert data["tag_index"] is None
+        assert data["scoring_pool"]["workers"] == 0
+        assert data["db_pool"]["max"] == 10 and data["db_pool"]["in_use"] >= 0
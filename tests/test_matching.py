@@ -0,0 +1,507 @@
+import time
+import pytest
+from app.database import query_one, query_all, execute, execute_returning, commit, query_stats
+from app.models import load_user
+from app.utils.geocell import cell_key, collect_by_rings
+from app.utils.matching import (
+    get_matching_candidates, get_suggestions, get_tag_ids_for_users, rank_suggestions,
+    sort_key, encode_cursor, decode_cursor, orientation_bucket, target_buckets,
+    BUCKET_GENDERS, BUCKET_PREFERENCES,
+)
+from app.utils.colike import build_colike_neighbours
+from app.utils.scoring_pool import start_scoring_pool, get_pool_stats
+from app.utils.suggestion_cache import ranked_page
+from app.utils.tag_index import get_tag_index
+from app.utils.tags import tag_mask, mask_to_bits, bits_to_mask
+
+SORT_MODES = [None, "age", "location", "fame", "tags"]
+ENGINES = ["python", "sql", "numpy"]
+
+
+def _tag_user(user_id, name):
+    tag = query_one("SELECT id FROM tags WHERE name = %s", (name,))
+    if not tag:
+        execute("INSERT INTO tags (name) VALUES (%s)", (name,))
+        tag = query_one("SELECT id FROM tags WHERE name = %s", (name,))
+    execute("INSERT INTO user_tags (user_id, tag_id) VALUES (%s, %s)", (user_id, tag["id"]))
+    commit()
+    return tag["id"]
+
+
+def _make_user(username, lat, lng, birth_date="1994-03-01", fame=0,
+               gender="female", preference="heterosexual"):
+    row = execute_returning(
+        "INSERT INTO users (username, email, password_hash, first_name, last_name, birth_date, "
+        "latitude, longitude, location_enabled, email_verified, gender, sexual_preference, fame_rating) "
+        "VALUES (%s, %s, 'x', %s, 'Test', %s, %s, %s, true, true, %s, %s, %s) RETURNING id",
+        (username, f"{username}@example.com", username.title(), birth_date,
+         lat, lng, gender, preference, fame),
+    )
+    commit()
+    return row["id"]
+
+
+@pytest.fixture
+def population(app, user):
+    """Candidates for `user` (male, heterosexual, Geneva) spread over distance buckets."""
+    with app.app_context():
+        spots = [
+            (46.2050, 6.1440, "1990-01-15", 40, ["music"]),
+            (46.2100, 6.1500, "1990-01-15", 40, ["music", "travel"]),
+            (46.5197, 6.6323, "2000-12-31", 5, []),
+            (46.9480, 7.4474, "1985-07-04", 90, ["music"]),
+            (47.3769, 8.5417, None, 0, ["travel"]),
+            (48.8566, 2.3522, "1999-02-28", 300, ["music"]),
+            (46.2044, 6.1432, "1996-06-15", 0, []),
+        ]
+        ids = []
+        for i, (lat, lng, birth, fame, tags) in enumerate(spots):
+            uid = _make_user(f"cand{i}", lat, lng, birth, fame)
+            for t in tags:
+                _tag_user(uid, t)
+            ids.append(uid)
+        return ids
+
+
+def _summary(results):
+    return [
+        (r["user"].id, r["score"], r["age"], r["common_tags"],
+         None if r["distance"] is None else round(r["distance"], 6))
+        for r in results
+    ]
+
+
+class TestTagLoading:
+    def test_bulk_loader_groups_by_user(self, app, user, user2):
+        with app.app_context():
+            music = query_one("SELECT id FROM tags WHERE name = 'music'")["id"]
+            travel = query_one("SELECT id FROM tags WHERE name = 'travel'")["id"]
+            tags = get_tag_ids_for_users([user, user2, 999999])
+            assert tags == {user: {music}, user2: {travel}, 999999: set()}
+
+    def test_bulk_loader_empty(self, app):
+        with app.app_context():
+            assert get_tag_ids_for_users([]) == {}
+
+    def test_suggestions_common_tags(self, app, user, user2):
+        with app.app_context():
+            _tag_user(user2, "music")
+            results = get_suggestions(load_user(user))
+            assert [r["user"].id for r in results] == [user2]
+            assert results[0]["common_tags"] == 1
+
+
+class TestRankingEngines:
+    @pytest.mark.parametrize("engine", ["sql", "numpy"])
+    @pytest.mark.parametrize("sort_by", SORT_MODES)
+    def test_engine_matches_python(self, app, user, population, sort_by, engine):
+        if engine == "numpy":
+            pytest.importorskip("numpy")
+        with app.app_context():
+            me = load_user(user)
+            py = get_suggestions(me, sort_by=sort_by, limit=None, engine="python")
+            other = get_suggestions(me, sort_by=sort_by, limit=None, engine=engine)
+            assert len(py) == len(population)
+            assert _summary(other) == _summary(py)
+
+    def test_sql_engine_without_bit_count(self, app, monkeypatch, user, population):
+        from app.utils import matching
+        monkeypatch.setattr(matching, "_has_bit_count", lambda: False)
+        with app.app_context():
+            me = load_user(user)
+            py = get_suggestions(me, sort_by="tags", limit=None, engine="python")
+            assert _summary(get_suggestions(me, sort_by="tags", limit=None, engine="sql")) == _summary(py)
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_pages_and_total(self, app, user, population, engine):
+        with app.app_context():
+            me = load_user(user)
+            full = get_suggestions(me, limit=None, engine=engine)
+            page, total = rank_suggestions(me, limit=3, offset=3, engine=engine)
+            assert total == len(population)
+            assert _summary(page) == _summary(full[3:6])
+
+    @pytest.mark.parametrize("sort_by", SORT_MODES)
+    def test_top_k_matches_full_sort(self, app, user, population, sort_by):
+        with app.app_context():
+            me = load_user(user)
+            full = get_suggestions(me, sort_by=sort_by, limit=None, engine="python")
+            for limit in (1, 3, len(population) + 5):
+                top = get_suggestions(me, sort_by=sort_by, limit=limit, engine="python")
+                assert _summary(top) == _summary(full[:limit])
+
+    def test_scoring_pool_matches_serial(self, app, user, population):
+        app.config.update(SCORING_WORKERS=2, SCORING_PARALLEL_THRESHOLD=1)
+        with app.app_context():
+            me = load_user(user)
+            serial = {
+                (sort_by, limit): get_suggestions(me, sort_by=sort_by, limit=limit, engine="python")
+                for sort_by in SORT_MODES for limit in (3, None)
+            }
+            pool = start_scoring_pool(app, 2)
+            try:
+                for (sort_by, limit), expected in serial.items():
+                    got = get_suggestions(me, sort_by=sort_by, limit=limit, engine="python")
+                    assert _summary(got) == _summary(expected)
+                near, total = rank_suggestions(me, filters={"location_max": "70"}, engine="python")
+                assert total == 4 and len(near) == 4
+                assert get_pool_stats()["parallel_runs"] >= len(serial) + 1
+            finally:
+                pool.shutdown()
+                app.extensions.pop("scoring_pool")
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_location_max(self, app, user, population, engine):
+        with app.app_context():
+            me = load_user(user)
+            results, total = rank_suggestions(
+                me, sort_by="location", filters={"location_max": "70"}, engine=engine
+            )
+            assert total == 4
+            assert all(r["distance"] <= 70 for r in results)
+            assert results[0]["distance"] == 0
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_query_count(self, app, runner, user, population, engine):
+        with app.app_context():
+            runner.invoke(args=["backfill-tag-masks"])
+            me = load_user(user)
+            query_stats(reset=True)
+            get_suggestions(me, limit=5, engine=engine)
+            stats = query_stats()
+            assert stats["queries"] == 1
+            assert stats["rows"] == (5 if engine == "sql" else len(population))
+
+
+def _legacy_orientation_sql(gender, preference):
+    """The gender/preference WHERE clauses used before orientation_bucket."""
+    where, params = ["true"], []
+    if gender and preference:
+        if preference == "heterosexual":
+            if gender == "male":
+                where.append("u.gender = 'female'")
+            elif gender == "female":
+                where.append("u.gender = 'male'")
+        elif preference == "homosexual":
+            where.append("u.gender = %s")
+            params.append(gender)
+    if gender:
+        where.append(
+            "(u.sexual_preference IS NULL OR u.sexual_preference = 'bisexual' OR "
+            "(u.sexual_preference = 'heterosexual' AND u.gender != %s) OR "
+            "(u.sexual_preference = 'homosexual' AND u.gender = %s))"
+        )
+        params.extend([gender, gender])
+    return " AND ".join(where), params
+
+
+class TestOrientationBuckets:
+    @pytest.fixture
+    def everyone(self, app):
+        with app.app_context():
+            return {
+                (g, p): _make_user(f"o{i}_{j}", 46.2, 6.1, gender=g, preference=p)
+                for i, g in enumerate(BUCKET_GENDERS)
+                for j, p in enumerate(BUCKET_PREFERENCES)
+            }
+
+    def test_generated_column(self, app, everyone):
+        with app.app_context():
+            for (g, p), uid in everyone.items():
+                row = query_one("SELECT orientation_bucket FROM users WHERE id = %s", (uid,))
+                assert row["orientation_bucket"] == orientation_bucket(g, p)
+            uid = everyone[("male", None)]
+            execute("UPDATE users SET sexual_preference = 'bisexual' WHERE id = %s", (uid,))
+            row = query_one("SELECT orientation_bucket FROM users WHERE id = %s", (uid,))
+            assert row["orientation_bucket"] == orientation_bucket("male", "bisexual")
+
+    @pytest.mark.parametrize("preference", BUCKET_PREFERENCES)
+    @pytest.mark.parametrize("gender", BUCKET_GENDERS)
+    def test_matches_legacy_clauses(self, app, everyone, gender, preference):
+        with app.app_context():
+            where, params = _legacy_orientation_sql(gender, preference)
+            legacy = query_all(f"SELECT id FROM users u WHERE {where} ORDER BY id", params)
+            bucketed = query_all(
+                "SELECT id FROM users u WHERE u.orientation_bucket = ANY(%s) ORDER BY id",
+                (target_buckets(gender, preference),),
+            )
+            assert [r["id"] for r in bucketed] == [r["id"] for r in legacy]
+
+
+class TestGeoCells:
+    def test_backfill_matches_python(self, app, runner, user, population):
+        with app.app_context():
+            result = runner.invoke(args=["backfill-geo-cells"])
+            assert "updated for 8 users" in result.output
+            assert query_one("SELECT COUNT(*) AS cnt FROM users WHERE geo_cell IS NULL")["cnt"] == 0
+            for uid in population + [user]:
+                row = query_one("SELECT latitude, longitude, geo_cell FROM users WHERE id = %s", (uid,))
+                assert row["geo_cell"] == cell_key(row["latitude"], row["longitude"])
+
+    def _ring_ids(self, viewer, wanted):
+        sql = "SELECT id FROM users WHERE id <> %s "
+        rows = collect_by_rings(
+            lambda cells, remaining: query_all(sql + "AND geo_cell = ANY(%s)", (viewer.id, cells)),
+            lambda scanned, remaining: query_all(
+                sql + "AND (geo_cell IS NULL OR NOT (geo_cell = ANY(%s))) LIMIT %s",
+                (viewer.id, scanned, remaining),
+            ),
+            viewer.latitude, viewer.longitude, wanted,
+        )
+        return [r["id"] for r in rows]
+
+    def test_ring_fetch_stops_early(self, app, runner, user, population):
+        with app.app_context():
+            runner.invoke(args=["backfill-geo-cells"])
+            near = self._ring_ids(load_user(user), 2)
+            assert set(near) == set(population[:2] + population[-1:])
+            assert len(self._ring_ids(load_user(user), 100)) == len(population)
+
+    def test_ring_fetch_includes_unbackfilled(self, app, user, population):
+        with app.app_context():
+            assert len(self._ring_ids(load_user(user), 3)) == 3
+
+    def test_map_users(self, logged_in_client, user2):
+        response = logged_in_client.get("/map/users")
+        assert response.status_code == 200
+        assert [u["id"] for u in response.get_json()] == [user2]
+
+
+class TestCursorPagination:
+    @pytest.mark.parametrize("engine", ENGINES)
+    @pytest.mark.parametrize("sort_by", SORT_MODES)
+    def test_keyset_walk_matches_full_ranking(self, app, user, population, sort_by, engine):
+        with app.app_context():
+            me = load_user(user)
+            full = get_suggestions(me, sort_by=sort_by, limit=None, engine=engine)
+            walked, after = [], None
+            while True:
+                page, total = rank_suggestions(me, sort_by, limit=2, after=after, engine=engine)
+                if not page:
+                    break
+                assert total == len(population)
+                walked.extend(page)
+                after = sort_key(page[-1], sort_by)
+            assert _summary(walked) == _summary(full)
+
+    @pytest.mark.parametrize("engine,depth", [("python", 500), ("python", 4), ("sql", 500)])
+    def test_cached_pages(self, app, user, population, engine, depth):
+        app.config["MATCHING_ENGINE"] = engine
+        app.config["SUGGESTIONS_CACHE_DEPTH"] = depth
+        with app.app_context():
+            me = load_user(user)
+            full = get_suggestions(me, sort_by="fame", limit=None)
+            walked, cursor = [], None
+            for _ in range(len(population)):
+                page, total, cursor = ranked_page(me, "fame", limit=3, cursor=cursor)
+                walked.extend(page)
+                if cursor is None:
+                    break
+            assert _summary(walked) == _summary(full)
+
+    def test_prev_link_steps_back(self, app, monkeypatch, logged_in_client, population):
+        import html
+        import re
+        from app.routes import browse
+        monkeypatch.setattr(browse, "PER_PAGE", 2)
+
+        def get(url):
+            body = logged_in_client.get(url).get_data(as_text=True)
+            cards = re.findall(r'href="/profile/view/(\d+)" class="card-link"', body)
+            links = {m[1]: html.unescape(m[0]) for m in re.findall(r'<a href="([^"]+)" class="page-link">[^<]*?(Prev|Next)', body)}
+            return cards, links
+
+        first, links = get("/browse/suggestions?sort=fame")
+        assert "Prev" not in links
+        second, links = get(links["Next"])
+        third, links = get(links["Next"])
+        assert len({*first, *second, *third}) == 6
+        back, links = get(links["Prev"])
+        assert back == second
+        back, links = get(links["Prev"])
+        assert back == first and "Prev" not in links
+
+    def test_cursor_bound_to_filters(self, app, user, population):
+        with app.app_context():
+            item = get_suggestions(load_user(user), sort_by="age", limit=1)[0]
+            token = encode_cursor(item, "age", {"fame_min": "1"})
+            assert decode_cursor(token, "age", {"fame_min": "1"}) == sort_key(item, "age")
+            assert decode_cursor(token, "age", {}) is None
+            assert decode_cursor(token, "fame", {"fame_min": "1"}) is None
+            assert decode_cursor("not-a-cursor", "age", {}) is None
+
+
+class TestTagMasks:
+    def test_backfill_matches_python(self, app, runner, user, population):
+        with app.app_context():
+            result = runner.invoke(args=["backfill-tag-masks"])
+            assert "updated for 8 users" in result.output
+            tags = get_tag_ids_for_users(population + [user])
+            for uid, ids in tags.items():
+                row = query_one("SELECT tag_mask FROM users WHERE id = %s", (uid,))
+                assert row["tag_mask"] == mask_to_bits(tag_mask(ids))
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_engines_with_masks(self, app, runner, user, population, engine):
+        with app.app_context():
+            me = load_user(user)
+            before = get_suggestions(me, sort_by="tags", limit=None, engine="python")
+            runner.invoke(args=["backfill-tag-masks"])
+            execute("UPDATE users SET tag_mask = NULL WHERE id = %s", (population[1],))
+            commit()
+            after = get_suggestions(load_user(user), sort_by="tags", limit=None, engine=engine)
+            assert _summary(after) == _summary(before)
+
+    def test_set_user_tags_writes_mask(self, app, user):
+        from app.routes.profile import set_user_tags
+        with app.app_context():
+            set_user_tags(user, ["#music", "hiking", "music"])
+            ids = get_tag_ids_for_users([user])[user]
+            row = query_one("SELECT tag_mask FROM users WHERE id = %s", (user,))
+            assert len(ids) == 2 and bits_to_mask(row["tag_mask"]) == tag_mask(ids)
+            set_user_tags(user, [])
+            assert query_one("SELECT tag_mask FROM users WHERE id = %s", (user,))["tag_mask"] == ""
+
+    def test_set_user_tags_statement_count(self, app, user):
+        from app.routes.profile import set_user_tags
+        with app.app_context():
+            query_stats(reset=True)
+            set_user_tags(user, ["a", "b", "c", "d", "e", "f", "music"])
+            # DELETE, tag upsert, id lookup, user_tags insert, mask update: independent of the tag count
+            assert query_stats()["queries"] == 5
+            assert len(get_tag_ids_for_users([user])[user]) == 7
+
+
+class TestTagIndex:
+    def test_union_and_intersect(self, app, user, population):
+        with app.app_context():
+            index = get_tag_index()
+            music = {user, population[0], population[1], population[3], population[5]}
+            assert index.union(["music"]) == sorted(music)
+            assert index.union(["music", "travel"]) == sorted(music | {population[4]})
+            assert index.intersect(["music", "travel"]) == [population[1]]
+            assert index.intersect(["music", "nope"]) == []
+            assert index.stats()["tags"] == 2 and index.stats()["postings"] == 7
+
+    def test_set_user_tags_updates_index(self, app, user, population):
+        from app.routes.profile import set_user_tags
+        with app.app_context():
+            index = get_tag_index()
+            set_user_tags(population[0], ["travel", "hiking"])
+            assert population[0] not in index.union(["music"])
+            assert index.intersect(["travel", "hiking"]) == [population[0]]
+            set_user_tags(population[0], [])
+            assert index.union(["hiking"]) == []
+            assert index.builds == 1
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_tag_filter_matches_subquery(self, app, user, population, engine):
+        with app.app_context():
+            me = load_user(user)
+            filters = {"tags": "#music, travel"}
+            indexed = get_suggestions(me, filters=filters, limit=None, engine=engine)
+            app.config["TAG_INDEX_ENABLED"] = False
+            plain = get_suggestions(me, filters=filters, limit=None, engine=engine)
+            assert len(plain) == 5
+            assert _summary(indexed) == _summary(plain)
+
+    def test_large_posting_list_uses_semi_join(self, app, user, population):
+        from app.utils.matching import _candidate_conditions, TAG_INDEX_MAX_IDS
+        with app.app_context():
+            me = load_user(user)
+            filters = {"tags": "music"}
+            plain = get_suggestions(me, filters=filters, limit=None)
+            index = get_tag_index()
+            # Ids of users this process has not seen yet (another worker's signups).
+            for uid in range(10 ** 6, 10 ** 6 + TAG_INDEX_MAX_IDS + 1):
+                index.set_user(uid, ["music"])
+            where, params = _candidate_conditions(me, filters)
+            assert any("user_tags" in w for w in where)
+            assert all(len(p) <= TAG_INDEX_MAX_IDS for p in params if isinstance(p, list))
+            assert _summary(get_suggestions(me, filters=filters, limit=None)) == _summary(plain)
+
+    def test_refreshes_in_background_when_old(self, app, user, population):
+        app.config["TAG_INDEX_MAX_AGE"] = 1
+        with app.app_context():
+            index = get_tag_index()
+            _tag_user(population[2], "travel")
+            index.built_at -= 5
+            assert get_tag_index() is index
+            deadline = time.monotonic() + 5
+            while index.builds < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert index.builds == 2 and not index.refreshing
+            assert population[2] in index.union(["travel"])
+
+    def test_edit_during_build_is_replayed(self, app, monkeypatch, user, population):
+        from app.utils import tag_index
+        index = tag_index.TagIndex()
+        load = tag_index.query_all
+
+        def load_then_edit(*args):
+            rows = load(*args)
+            # Committed by another request after the build's SELECT ran.
+            index.set_user(population[0], ["hiking"])
+            return rows
+
+        monkeypatch.setattr(tag_index, "query_all", load_then_edit)
+        with app.app_context():
+            index.rebuild()
+        assert index.union(["hiking"]) == [population[0]]
+        assert population[0] not in index.union(["music"])
+
+
+class TestColike:
+    @pytest.fixture
+    def likes(self, app, user, population):
+        """`user` and three other men all like population[0]; two of them also like [3], one [5]."""
+        with app.app_context():
+            likers = [_make_user(f"liker{i}", 46.2, 6.1, gender="male") for i in range(3)]
+            pairs = [(user, population[0])]
+            pairs += [(liker, population[0]) for liker in likers]
+            pairs += [(likers[0], population[3]), (likers[1], population[3]), (likers[2], population[5])]
+            for liker, liked in pairs:
+                execute("INSERT INTO likes (liker_id, liked_id) VALUES (%s, %s)", (liker, liked))
+            commit()
+            return likers
+
+    def _neighbours(self, user_id):
+        rows = query_all(
+            "SELECT similar_id, score FROM user_similar WHERE user_id = %s ORDER BY score DESC", (user_id,)
+        )
+        return [(r["similar_id"], r["score"]) for r in rows]
+
+    def test_build_neighbours(self, app, population, likes):
+        with app.app_context():
+            assert build_colike_neighbours(chunk_size=1) == 3
+            # cosine of the liker sets: 2 / sqrt(4 * 2) and 1 / sqrt(4 * 1)
+            assert self._neighbours(population[0]) == [(population[3], 71), (population[5], 50)]
+            assert self._neighbours(population[3]) == [(population[0], 71)]
+            build_colike_neighbours(top_n=1)
+            assert self._neighbours(population[0]) == [(population[3], 71)]
+
+    def test_rebuild_drops_unliked(self, app, population, likes):
+        with app.app_context():
+            build_colike_neighbours()
+            execute("DELETE FROM likes WHERE liked_id = %s", (population[5],))
+            commit()
+            build_colike_neighbours()
+            assert self._neighbours(population[5]) == []
+            assert self._neighbours(population[0]) == [(population[3], 71)]
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_weight_blends_into_score(self, app, user, population, likes, engine):
+        with app.app_context():
+            build_colike_neighbours()
+            me = load_user(user)
+            plain = {r["user"].id: r["score"] for r in get_suggestions(me, limit=None, engine=engine)}
+            app.config["COLIKE_WEIGHT"] = 10
+            blended = get_suggestions(me, limit=None, engine=engine)
+            assert {r["user"].id: r["score"] - plain[r["user"].id] for r in blended} == {
+                uid: {population[3]: 710, population[5]: 500}.get(uid, 0) for uid in population
+            }
+            assert _summary(blended) == _summary(get_suggestions(me, limit=None, engine="python"))
+
+    def test_cli(self, app, runner, population, likes):
+        result = runner.invoke(args=["build-colike", "--top-n", "5"])
+        assert "Co-like neighbours built for 3 users." in result.output
@@ -1,5 +1,17 @@
+import pickle
+import threading
+import time
+import psycopg2
 import pytest
-from app.database import query_one, execute, execute_returning, commit
+from flask import session
+from app import database
+from app.database import (
+    query_one, query_all, execute, execute_returning, commit, rollback, get_db, prepared,
+    BlockingPool, PoolTimeout, _Connection, hold_stats, init_replicas, routing_stats,
+    execute_values, copy_rows, query_iter, query_stats, Row,
+)
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from app.models import load_user
 
 
 class TestUserModel:
@@ -101,3 +113,302 @@ class TestNotificationModel:
             commit()
             assert row["id"] is not None
             assert row["is_read"] is False
+
+
+class TestPreparedStatements:
+    def _server_statements(self):
+        return {r["name"] for r in query_all("SELECT name FROM pg_prepared_statements")}
+
+    def test_prepared_once_per_connection(self, app, user):
+        app.config["PREPARED_STATEMENTS"] = True
+        with app.app_context():
+            stmt = prepared("SELECT %s::int + 1 AS v")
+            assert query_one(stmt, (41,))["v"] == 42
+            assert query_one(stmt, (1,))["v"] == 2
+            assert stmt.name in get_db().prepared
+            assert stmt.name in self._server_statements()
+            assert load_user(user).id == user
+
+    def test_switch_off_runs_plain_sql(self, app):
+        with app.app_context():
+            stmt = prepared("SELECT %s::int + 2 AS v")
+            assert query_one(stmt, (40,))["v"] == 42
+            assert stmt.name not in self._server_statements()
+
+    def test_reprepares_after_session_reset(self, app):
+        app.config["PREPARED_STATEMENTS"] = True
+        with app.app_context():
+            stmt = prepared("SELECT %s::int + 3 AS v")
+            query_one(stmt, (0,))
+            execute("DEALLOCATE ALL")
+            with pytest.raises(psycopg2.errors.InvalidSqlStatementName):
+                query_one(stmt, (0,))
+            rollback()
+            assert query_one(stmt, (39,))["v"] == 42
+
+
+class TestConnectionPool:
+    @pytest.fixture
+    def small_pool(self, app):
+        p = BlockingPool(1, 1, app.config["DATABASE_URL"], timeout=0.2, connection_factory=_Connection)
+        yield p
+        p.closeall()
+
+    def test_times_out_when_exhausted(self, small_pool):
+        small_pool.getconn()
+        with pytest.raises(PoolTimeout):
+            small_pool.getconn()
+        assert small_pool.stats()["timeouts"] == 1
+        assert small_pool.stats()["in_use"] == 1
+
+    def test_waits_for_returned_connection(self, small_pool):
+        conn = small_pool.getconn()
+        small_pool.timeout = 5
+        threading.Timer(0.1, small_pool.putconn, (conn,)).start()
+        assert small_pool.getconn() is conn
+        stats = small_pool.stats()
+        assert stats["checkouts"] == 2 and stats["wait_ms_max"] >= 50
+        assert sum(stats["wait_ms_buckets"].values()) == 2
+
+    def test_replaces_dead_connection(self, app, small_pool):
+        conn = small_pool.getconn()
+        pid = conn.get_backend_pid()
+        small_pool.putconn(conn)
+        with app.app_context():
+            execute("SELECT pg_terminate_backend(%s)", (pid,))
+            commit()
+        small_pool.health_check_idle = 0.01
+        time.sleep(0.05)
+        fresh = small_pool.getconn()
+        assert fresh.get_backend_pid() != pid
+        assert small_pool.stats()["discarded"] == 1
+
+    def test_pool_timeout_is_503(self, app, client):
+        def busy():
+            raise PoolTimeout("no database connection free within 5s")
+        app.add_url_rule("/_busy", "busy", busy)
+        response = client.get("/_busy")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+
+class TestReadOnlyFastPath:
+    def test_reads_run_without_transaction(self, app, user):
+        with app.app_context():
+            query_one("SELECT id FROM users WHERE id = %s", (user,))
+            conn = get_db()
+            assert conn.autocommit
+            assert conn.info.transaction_status == TRANSACTION_STATUS_IDLE
+            execute("UPDATE users SET fame_rating = 1 WHERE id = %s", (user,))
+            assert not conn.autocommit
+            assert conn.info.transaction_status == TRANSACTION_STATUS_INTRANS
+            query_one("SELECT id FROM users WHERE id = %s", (user,))
+            assert conn.info.transaction_status == TRANSACTION_STATUS_INTRANS
+            commit()
+            assert conn.autocommit
+
+    def test_write_committed_at_teardown(self, app, user):
+        with app.app_context():
+            execute("UPDATE users SET fame_rating = 7 WHERE id = %s", (user,))
+        with app.app_context():
+            assert query_one("SELECT fame_rating FROM users WHERE id = %s", (user,))["fame_rating"] == 7
+
+    def test_switch_off_keeps_transactions(self, app, user):
+        app.config["DB_READ_AUTOCOMMIT"] = False
+        with app.app_context():
+            query_one("SELECT id FROM users WHERE id = %s", (user,))
+            assert get_db().info.transaction_status == TRANSACTION_STATUS_INTRANS
+
+    def test_hold_time_per_endpoint(self, app, user):
+        with app.app_context(), app.test_request_context("/notifications/count"):
+            query_one("SELECT id FROM users WHERE id = %s", (user,))
+            time.sleep(0.02)
+        entry = hold_stats()["notifications.count"]
+        assert entry["requests"] >= 1 and entry["held_ms_max"] >= 20 and entry["writes"] == 0
+
+
+class TestReplicaRouting:
+    @pytest.fixture
+    def replica(self, app):
+        """A second database on the test server standing in for a read replica."""
+        base, _ = app.config["DATABASE_URL"].rsplit("/", 1)
+        conn = psycopg2.connect(app.config["DATABASE_URL"])
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = 'matcha_test_replica'")
+            if not cur.fetchone():
+                cur.execute("CREATE DATABASE matcha_test_replica")
+        conn.close()
+        init_replicas(app, base + "/matcha_test_replica")
+        yield
+        init_replicas(app, [])
+
+    def _database(self):
+        return query_one("SELECT current_database() AS db")["db"]
+
+    def test_reads_go_to_replica(self, app, replica):
+        with app.app_context():
+            before = routing_stats()["replica"]
+            assert self._database() == "matcha_test_replica"
+            assert query_all("SELECT current_database() AS db")[0]["db"] == "matcha_test_replica"
+            assert routing_stats()["replica"] == before + 2
+
+    def test_reads_stick_to_primary_after_write(self, app, replica):
+        with app.app_context(), app.test_request_context("/"):
+            assert self._database() == "matcha_test_replica"
+            execute("SELECT 1")
+            assert self._database() == "matcha_test"
+            assert session["db_primary_until"] > time.time()
+
+    def test_recent_writer_reads_primary(self, app, replica):
+        with app.app_context(), app.test_request_context("/"):
+            session["db_primary_until"] = time.time() + 5
+            assert self._database() == "matcha_test"
+
+    def test_maintenance_reads_primary(self, app, replica, user):
+        from app.utils.fame import reconcile_fame
+        from app.utils.tag_index import TagIndex
+        with app.app_context():
+            # The stand-in replica has no tables, so these only pass when read from the primary.
+            assert reconcile_fame() == []
+            index = TagIndex()
+            index.rebuild()
+            assert index.union(["music"]) == [user]
+
+    def test_falls_back_when_replica_down(self, app, replica):
+        database._replica_pools[0].closeall()
+        with app.app_context():
+            before = routing_stats()["fallback"]
+            assert self._database() == "matcha_test"
+            assert routing_stats()["fallback"] == before + 1
+
+
+class TestBulkWrites:
+    def test_execute_values_pages(self, app, user):
+        with app.app_context():
+            inserted = execute_values(
+                "INSERT INTO tags (name) VALUES %s ON CONFLICT (name) DO NOTHING",
+                [(f"bulk{i}",) for i in range(25)] + [("bulk0",)], page_size=10,
+            )
+            assert inserted == 25
+            tag_id = query_one("SELECT id FROM tags WHERE name = 'bulk0'")["id"]
+            rows = execute_values(
+                "INSERT INTO user_tags (user_id, tag_id) VALUES %s RETURNING tag_id", [(user, tag_id)], fetch=True
+            )
+            assert rows == [{"tag_id": tag_id}]
+
+    def test_copy_rows_escapes(self, app, user, user2):
+        with app.app_context():
+            text = "tab\there\nnew line \\ back\\slash"
+            count = copy_rows(
+                "messages", ("sender_id", "receiver_id", "content", "is_read"),
+                ((user, user2, text if i == 0 else f"m{i}", None) for i in range(3)),
+            )
+            assert count == 3
+            rows = query_all("SELECT content, is_read FROM messages ORDER BY id")
+            assert rows[0] == {"content": text, "is_read": None}
+            assert [r["content"] for r in rows[1:]] == ["m1", "m2"]
+
+    def test_reorder_images_bulk(self, app, logged_in_client, user):
+        with app.app_context():
+            ids = [
+                execute_returning(
+                    "INSERT INTO user_images (user_id, filename, upload_order) "
+                    "VALUES (%s, %s, %s) RETURNING id",
+                    (user, f"img{i}.jpg", i),
+                )["id"]
+                for i in range(3)
+            ]
+            commit()
+        order = [ids[2], ids[0], 999999, ids[1]]
+        response = logged_in_client.post("/profile/reorder-images", json={"order": order})
+        assert response.get_json() == {"success": True}
+        with app.app_context():
+            rows = query_all(
+                "SELECT upload_order, is_profile_picture FROM user_images WHERE id = ANY(%s) ORDER BY id",
+                (ids,),
+            )
+            assert [(r["upload_order"], r["is_profile_picture"]) for r in rows] == [
+                (1, False), (3, False), (0, True),
+            ]
+            pp = query_one("SELECT profile_picture_id FROM users WHERE id = %s", (user,))
+            assert pp["profile_picture_id"] == ids[2]
+
+
+class TestQueryIter:
+    def test_streams_in_batches(self, app):
+        with app.app_context():
+            query_stats(reset=True)
+            rows = list(query_iter("SELECT n, n * 2 FROM generate_series(1, 25) n", fetch_size=10))
+            assert rows == [(n, n * 2) for n in range(1, 26)]
+            assert query_stats() == {"queries": 1, "rows": 25}
+            conn = get_db()
+            assert conn.autocommit
+            assert conn.info.transaction_status == TRANSACTION_STATUS_IDLE
+
+    def test_close_ends_read_transaction(self, app):
+        with app.app_context():
+            rows = query_iter("SELECT n FROM generate_series(1, 100) n", fetch_size=10)
+            assert next(rows) == (1,)
+            assert get_db().info.transaction_status == TRANSACTION_STATUS_INTRANS
+            rows.close()
+            assert get_db().autocommit
+
+    def test_commits_between_rows(self, app, user):
+        with app.app_context():
+            seen = []
+            for (n,) in query_iter("SELECT n FROM generate_series(1, 5) n", fetch_size=2):
+                execute("UPDATE users SET fame_rating = %s WHERE id = %s", (n, user))
+                commit()
+                seen.append(n)
+            assert seen == [1, 2, 3, 4, 5]
+        with app.app_context():
+            assert query_one("SELECT fame_rating FROM users WHERE id = %s", (user,))["fame_rating"] == 5
+
+    def test_teardown_closes_abandoned_iterator(self, app):
+        with app.app_context():
+            rows = query_iter("SELECT n FROM generate_series(1, 100) n", fetch_size=10)
+            next(rows)
+            conn = get_db()
+        assert rows.gi_frame is None
+        assert conn.autocommit
+        assert conn.info.transaction_status == TRANSACTION_STATUS_IDLE
+
+
+class TestRowDecoding:
+    def test_row_reads_like_dict_and_object(self, app, user):
+        with app.app_context():
+            row = query_one("SELECT id, username, NULL AS bio FROM users WHERE id = %s", (user,))
+            assert isinstance(row, Row)
+            assert row["username"] == row.username == row.get("username") == "testuser"
+            assert row.get("missing", 1) == 1 and "bio" in row and "missing" not in row
+            assert dict(row) == {"id": user, "username": "testuser", "bio": None}
+            assert row == {"id": user, "username": "testuser", "bio": None}
+            assert list(row.keys()) == ["id", "username", "bio"]
+            assert row[1] == "testuser"
+            with pytest.raises(KeyError):
+                row["missing"]
+            with pytest.raises(AttributeError):
+                row.missing
+
+    def test_rows_share_class_per_column_list(self, app, user, user2):
+        with app.app_context():
+            a, b = query_all("SELECT id, username FROM users WHERE id IN (%s, %s) ORDER BY id", (user, user2))
+            assert type(a) is type(b)
+            assert type(query_one("SELECT id, username FROM users WHERE id = %s", (user,))) is type(a)
+
+    def test_duplicate_columns_last_wins(self, app):
+        with app.app_context():
+            row = query_one("SELECT 1 AS v, 2 AS v")
+            assert row.v == row["v"] == 2
+            assert dict(row) == {"v": 2}
+            assert tuple(row) == (1, 2)
+
+    def test_pickle_and_returning(self, app, user):
+        with app.app_context():
+            row = execute_returning(
+                "UPDATE users SET fame_rating = 3 WHERE id = %s RETURNING id, fame_rating", (user,)
+            )
+            assert row.fame_rating == 3
+            copy = pickle.loads(pickle.dumps(row))
+            assert copy == row and copy.fame_rating == 3
@@ -1,7 +1,7 @@
 import pytest
 from app.utils.security import is_password_strong, sanitize_string
 from app.utils.validators import is_valid_email, is_valid_username, is_valid_name
-from app.utils.matching import calculate_age, haversine_distance
+from app.utils.matching import calculate_age, haversine_distance, bounding_box
 from app.utils.tags import canonical_tag_name, tags_display_form_value, split_tags_input
 from datetime import date
 
@@ -99,6 +99,39 @@ class TestMatching:
         distance = haversine_distance(47.0, 8.0, 47.0, 8.0)
         assert distance == 0
 
+    def test_bounding_box_contains_radius(self):
+        (lat_min, lat_max), lngs = bounding_box(46.2044, 6.1432, 100)
+        assert len(lngs) == 1
+        lng_min, lng_max = lngs[0]
+        assert 99.9 < haversine_distance(46.2044, 6.1432, lat_max, 6.1432) < 100.1
+        assert haversine_distance(46.2044, 6.1432, 46.2044, lng_max) > 100
+        assert lat_min < 46.2044 < lat_max and lng_min < 6.1432 < lng_max
+
+    def test_bounding_box_antimeridian(self):
+        _, lngs = bounding_box(0.0, 179.9, 50)
+        assert len(lngs) == 2
+        assert lngs[0][1] == 180.0 and lngs[1][0] == -180.0
+
+    def test_bounding_box_pole(self):
+        (lat_min, lat_max), lngs = bounding_box(89.9, 10.0, 50)
+        assert lngs == [] and lat_max == 90.0
+
+
+class TestGeoCells:
+    def test_cell_key_neighbours(self):
+        from app.utils.geocell import cell_key, COLS
+        assert cell_key(46.2044, 6.1432) == cell_key(46.21, 6.15)
+        assert cell_key(46.2044, 6.1432) + 1 == cell_key(46.2044, 6.30)
+        assert cell_key(0.1, 179.99) - COLS + 1 == cell_key(0.1, -179.99)
+        assert cell_key(None, 6.0) is None
+
+    def test_ring_sizes(self):
+        from app.utils.geocell import ring_cells
+        assert len(ring_cells(46.2, 6.1, 0)) == 1
+        assert len(ring_cells(46.2, 6.1, 1)) == 8
+        assert len(ring_cells(46.2, 6.1, 3)) == 24
+        assert len(ring_cells(89.99, 6.1, 1)) == 5
+
 
 class TestCanonicalTags:
     def test_strip_hash(self):
@@ -115,6 +148,20 @@ class TestCanonicalTags:
         assert split_tags_input("#rock  roll") == ["#rock", "roll"]
 
 
+class TestTagMasks:
+    def test_round_trip(self):
+        from app.utils.tags import tag_mask, mask_to_bits, bits_to_mask
+        mask = tag_mask([1, 3, 8])
+        assert mask_to_bits(mask) == "10100001"
+        assert bits_to_mask("10100001") == mask
+        assert mask_to_bits(tag_mask([])) == "" and bits_to_mask("") == 0
+
+    def test_common_count(self):
+        from app.utils.tags import tag_mask, common_tag_count
+        assert common_tag_count(tag_mask([1, 2, 70]), tag_mask([2, 70, 71])) == 2
+        assert common_tag_count(tag_mask([5]), 0) == 0
+
+
 class TestBuildPlaceLabel:
     def test_neighbourhood_and_city(self):
         from app.utils.reverse_geocode import build_place_label_from_address